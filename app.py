@@ -1,9 +1,55 @@
 import streamlit as st
-import replicate
-from PIL import Image
+import os
+import re
+import hashlib
+import html
 import io
+import time
+import uuid
 from datetime import datetime
-import requests
+from dataclasses import replace
+
+from refacer.batch import DEFAULT_CONCURRENCY as DEFAULT_BATCH_CONCURRENCY
+from refacer.batch import BatchRunner, ManifestError, read_manifest
+from refacer import metrics
+from refacer.downloads import fetch_and_process, fetch_to_store, get_executor
+from refacer.encoding import (
+    DEFAULT_DOWNLOAD_ENCODING,
+    DEFAULT_MODEL_ENCODING,
+    ENCODINGS,
+    format_size,
+    from_bytes,
+)
+from refacer.history import DEFAULT_HISTORY_BYTES, DEFAULT_PAGE_SIZE, THUMBNAIL_SIZE, History, HistoryOutput
+from refacer.imaging import (
+    DEFAULT_MAX_MEGAPIXELS,
+    FINAL_SIZE,
+    ImageTooLarge,
+    check_pixel_budget,
+    load_preview_base,
+    probe,
+    render_preview,
+    render_thumbnail,
+)
+from refacer.jobs import DEFAULT_MAX_WORKERS, PROCESSING, QUEUED, STARTING, SUCCEEDED, JobManager, LazyClient
+from refacer import limits
+from refacer.media_store import DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS, MediaStore
+from refacer import pool as image_pool
+from refacer.pool import PoolBusy, prepare_input, prepare_output, prepare_upload, run_in_pool
+from refacer.result_cache import DEFAULT_CACHE_BYTES, ResultCache, make_key
+from refacer.session_media import DEFAULT_SESSION_BYTES, DEFAULT_TOTAL_BYTES, SessionMedia
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Result cache, history, media files and metrics. Benchmarks point this at
+# a scratch directory; Streamlit serves static/ only from APP_DIR, so the
+# app itself keeps the default
+DATA_DIR = os.environ.get('REFACER_DATA_DIR', APP_DIR)
+MB = 1024 * 1024
+# Result images kept per generation
+MAX_RESULT_IMAGES = 3
+# The video player streams from the provider only while its URL stays valid
+# this much longer, so a started playback is not cut off
+VIDEO_STREAM_MARGIN_SECONDS = 5 * 60
 
 # Page configuration
 st.set_page_config(
@@ -12,228 +58,506 @@ st.set_page_config(
     layout="wide"
 )
 
-# Light theme with Source Sans Pro font
-st.markdown("""
-<style>
-    /* Import Source Sans Pro font */
-    @import url('https://fonts.googleapis.com/css2?family=Source+Sans+Pro:wght@300;400;600;700&display=swap');
-
-    /* Main app styling - LIGHT THEME */
-    .stApp {
-        background: linear-gradient(135deg, #f5f5f5 0%, #ffffff 50%, #f5f5f5 100%);
-        background-attachment: fixed;
-        font-family: 'Source Sans Pro', sans-serif !important;
-    }
-
-    /* All text elements use Source Sans Pro */
-    * {
-        font-family: 'Source Sans Pro', sans-serif !important;
-    }
-
-    /* Headers styling */
-    h1 {
-        font-size: 3.625rem !important;
-        font-weight: 700 !important;
-        color: #1a1a1a !important;
-    }
-
-    h2 {
-        font-size: 2.125rem !important;
-        color: #2d2d2d !important;
-        font-weight: 600 !important;
-    }
-
-    h3 {
-        color: #404040 !important;
-        font-size: 1.625rem !important;
-        font-weight: 600 !important;
-    }
-
-    /* Regular text */
-    p, div, span, label {
-        font-size: calc(1rem + 2px) !important;
-        color: #1a1a1a !important;
-    }
-
-    /* Sidebar styling */
-    section[data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #ffffff 0%, #f8f8f8 100%);
-        border-right: 2px solid #e0e0e0;
-    }
-
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(135deg, #4a90e2 0%, #357abd 100%);
-        color: #ffffff !important;
-        border: 2px solid #357abd;
-        border-radius: 8px;
-        font-weight: 600;
-        font-size: calc(1rem + 2px) !important;
-        transition: all 0.3s ease;
-    }
-
-    .stButton > button:hover {
-        background: linear-gradient(135deg, #5a9def 0%, #4a90e2 100%);
-        border-color: #4a90e2;
-        box-shadow: 0 4px 8px rgba(74, 144, 226, 0.3);
-    }
-
-    /* Primary button */
-    .stButton > button[kind="primary"] {
-        background: linear-gradient(135deg, #4a90e2 0%, #357abd 100%);
-        border: 2px solid #357abd;
-    }
-
-    .stButton > button[kind="primary"]:hover {
-        background: linear-gradient(135deg, #5a9def 0%, #4a90e2 100%);
-        box-shadow: 0 6px 12px rgba(74, 144, 226, 0.4);
-    }
-
-    /* Text input and textarea styling */
-    .stTextArea textarea, .stTextInput input {
-        background-color: #ffffff !important;
-        color: #1a1a1a !important;
-        border: 2px solid #d0d0d0 !important;
-        border-radius: 6px;
-        font-size: calc(1rem + 2px) !important;
-    }
-
-    .stTextArea textarea:focus, .stTextInput input:focus {
-        border-color: #4a90e2 !important;
-    }
-
-    /* Placeholder text */
-    .stTextArea textarea::placeholder {
-        color: #888888 !important;
-        opacity: 0.7;
-    }
-
-    /* File uploader */
-    section[data-testid="stFileUploader"] > div {
-        background-color: #f9f9f9 !important;
-        border: 3px dashed #4a90e2 !important;
-        border-radius: 8px;
-        padding: 20px;
-    }
-
-    section[data-testid="stFileUploader"] label {
-        color: #1a1a1a !important;
-        font-size: calc(1rem + 2px) !important;
-        font-weight: 600 !important;
-    }
-
-    section[data-testid="stFileUploader"] small {
-        color: #666666 !important;
-        font-size: calc(0.875rem + 2px) !important;
-    }
-
-    /* Metrics styling */
-    div[data-testid="stMetricValue"] {
-        color: #1a1a1a !important;
-        font-size: calc(2rem + 2px) !important;
-        font-weight: 700 !important;
-    }
-
-    div[data-testid="stMetricLabel"] {
-        color: #404040 !important;
-        font-size: calc(0.875rem + 2px) !important;
-        font-weight: 600 !important;
-    }
-
-    /* Alert blocks styling */
-    .stAlert {
-        background-color: #f0f7ff !important;
-        border: 1px solid #4a90e2 !important;
-        color: #1a1a1a !important;
-    }
-
-    /* Dividers */
-    hr {
-        border-color: #e0e0e0 !important;
-    }
-
-    /* Logo in header */
-    .header-logo {
-        position: fixed;
-        top: 1rem;
-        left: 1rem;
-        z-index: 999;
-        max-width: 120px;
-    }
-
-    .header-logo img {
-        width: 100%;
-        height: auto;
-    }
-
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        background-color: #f5f5f5;
-        border-radius: 4px;
-        font-weight: 600;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Light theme with Source Sans Pro font, minified once per process
+@st.cache_resource
+def get_page_style():
+    """Returns the <style> block built from style.css"""
+    with open(os.path.join(APP_DIR, 'style.css')) as f:
+        css = f.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    return f"<style>{' '.join(css.split())}</style>"
+
+st.markdown(get_page_style(), unsafe_allow_html=True)
+
+# CPU-bound image work from all sessions goes through one bounded pool
+@st.cache_resource
+def get_image_pool():
+    """Configures the process-wide image pool from secrets.toml"""
+    return image_pool.configure(
+        kind=st.secrets.get("IMAGE_POOL", image_pool.DEFAULT_KIND),
+        max_workers=st.secrets.get("IMAGE_POOL_WORKERS", None),
+        max_megapixels=st.secrets.get("MAX_UPLOAD_MEGAPIXELS", DEFAULT_MAX_MEGAPIXELS),
+    )
 
-# Function to fix image orientation
-def fix_image_orientation(image):
-    """Fixes image orientation based on EXIF data"""
-    try:
-        from PIL import ImageOps
-        return ImageOps.exif_transpose(image)
-    except Exception as e:
-        return image
-
-# Function to crop image to 9:16 with custom position
-def crop_to_9_16(image, crop_position='center'):
-    """Crops image to 9:16 format with adjustable position"""
-    target_ratio = 9 / 16
-    width, height = image.size
-    current_ratio = width / height
-
-    if current_ratio > target_ratio:
-        # Image too wide, crop sides
-        new_width = int(height * target_ratio)
-        if crop_position == 'left':
-            left = 0
-        elif crop_position == 'right':
-            left = width - new_width
-        else:  # center
-            left = (width - new_width) // 2
-        image = image.crop((left, 0, left + new_width, height))
-    elif current_ratio < target_ratio:
-        # Image too tall, crop top and bottom
-        new_height = int(width / target_ratio)
-        if crop_position == 'top':
-            top = 0
-        elif crop_position == 'bottom':
-            top = height - new_height
-        else:  # center
-            top = (height - new_height) // 2
-        image = image.crop((0, top, width, top + new_height))
-
-    return image
-
-# Function to resize to final dimensions
-def resize_to_final(image):
-    """Resizes image to 1080x1920"""
-    return image.resize((1080, 1920), Image.Resampling.LANCZOS)
-
-# Combined function for backward compatibility
-def fix_image_orientation_and_resize(image, crop_position='center'):
-    """Fixes orientation, crops to 9:16, and resizes"""
-    image = fix_image_orientation(image)
-    image = crop_to_9_16(image, crop_position)
-    image = resize_to_final(image)
-    return image
-
-# Initialize Replicate API
+get_image_pool()
+
+# Preprocessing cache, shared across sessions. Each entry holds one encoded
+# 1080x1920 image (at most a few MB as PNG), so the entry cap bounds memory;
+# least recently used entries are evicted first.
+PREPROCESS_CACHE_ENTRIES = 32
+
+def get_upload_digest(uploaded_file):
+    """Returns SHA-256 digest of an uploaded file, hashed once per upload"""
+    digests = st.session_state.setdefault('upload_digests', {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
+
+@st.cache_data(max_entries=PREPROCESS_CACHE_ENTRIES, show_spinner=False)
+def get_upload_size(digest, _data):
+    """Returns image size after EXIF orientation fix, memoized per upload digest.
+
+    Read from the headers only; raises ImageTooLarge for uploads over the
+    megapixel budget before anything is decoded.
+    """
+    info = probe(_data)
+    check_pixel_budget(info)
+    return info.oriented_size
+
+@st.cache_data(max_entries=PREPROCESS_CACHE_ENTRIES, show_spinner=False)
+def preprocess_upload(digest, crop_position, target_size, encoding, _data):
+    """Fixes orientation, crops to 9:16, resizes and encodes, memoized per (digest, crop, size, encoding)"""
+    with metrics.span('preprocess'):
+        encoded = run_in_pool(prepare_upload, _data, crop_position, target_size, encoding)
+    metrics.observe('encode', encoded.seconds)
+    return encoded
+
+@st.cache_resource(max_entries=PREPROCESS_CACHE_ENTRIES, show_spinner=False)
+def get_preview_base(digest, _data):
+    """Returns small oriented base image for crop previews, memoized per upload digest"""
+    return load_preview_base(_data)
+
+@st.cache_data(max_entries=PREPROCESS_CACHE_ENTRIES * 3, show_spinner=False)
+def get_crop_preview(digest, crop_position, _data):
+    """Returns JPEG crop preview thumbnail, memoized per (digest, crop)"""
+    return render_preview(get_preview_base(digest, _data), crop_position)
+
+@st.cache_data(max_entries=PREPROCESS_CACHE_ENTRIES, show_spinner=False)
+def get_upload_thumbnail(digest, _data):
+    """Returns JPEG thumbnail of a whole upload, memoized per digest"""
+    return render_thumbnail(_data)
+
+@st.cache_data(max_entries=PREPROCESS_CACHE_ENTRIES, show_spinner=False)
+def encode_upload(digest, encoding, _data):
+    """Encodes an upright upload (no crop) on the image pool, memoized per (digest, encoding)"""
+    return run_in_pool(prepare_input, _data, encoding)
+
+def get_final_image(uploaded_file, crop_position, encoding):
+    """Returns the encoded 1080x1920 render of an upload, rendered on first use"""
+    digest = get_upload_digest(uploaded_file)
+    return preprocess_upload(digest, crop_position, FINAL_SIZE, encoding, uploaded_file.getvalue())
+
+def get_setting_index(options, key, default):
+    """Index of a secrets.toml setting in options, falling back to default"""
+    value = st.secrets.get(key, default)
+    return options.index(value if value in options else default)
+
+def format_encode_stats(encoded_images):
+    """One-line summary of model input encoding"""
+    total_bytes = sum(e.size for e in encoded_images)
+    encode_ms = sum(e.seconds for e in encoded_images) * 1000
+    return (f"Model input: {len(encoded_images)} × {encoded_images[0].encoding.label}, "
+            f"{format_size(total_bytes)}, encoded in {encode_ms:.0f} ms")
+
+def format_job_timings(job):
+    """One-line summary of where a job spent its time"""
+    if job.cached:
+        return f"cache hit · saved ~{job.timings.get('saved', 0):.0f} s"
+    parts = [f"{stage.replace('_', ' ')} {job.timings[stage]:.2f} s"
+             for stage in ('upload', 'queue', 'inference', 'first_result', 'postprocess') if stage in job.timings]
+    parts.append(f"total {job.elapsed:.1f} s")
+    if len(job.subscribers) > 1:
+        parts.append(f"shared by {len(job.subscribers)} sessions")
+    return " · ".join(parts)
+
+# Pipeline metrics: Prometheus text format on METRICS_PORT (if set) and in
+# a file that a node_exporter textfile collector can pick up
+@st.cache_resource
+def start_metrics_exporter():
+    """Starts the metrics exporter once per process"""
+    metrics.start_exporter(
+        port=st.secrets.get("METRICS_PORT", None),
+        path=st.secrets.get("METRICS_FILE", os.path.join(DATA_DIR, '.cache', 'metrics.prom')),
+    )
+
+start_metrics_exporter()
+
+# Media store for generated videos: files are streamed to static/media and
+# served by Streamlit static serving, session state only keeps a handle
+@st.cache_resource
+def get_media_store():
+    """Returns the process-wide media store"""
+    return MediaStore(
+        os.path.join(DATA_DIR, 'static', 'media'),
+        url_prefix='app/static/media',
+        ttl_seconds=st.secrets.get("MEDIA_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+        max_bytes=st.secrets.get("MEDIA_MAX_MB", DEFAULT_MAX_BYTES // MB) * MB,
+    )
+
+media_store = get_media_store()
+
+# Result images and model inputs of sessions: session state keeps MediaRefs,
+# the bytes stay in memory within per-session and process-wide budgets and
+# spill to the media store beyond them, when idle or once served by URL
+@st.cache_resource
+def get_session_media():
+    """Returns the process-wide session media accounting, swept in the background"""
+    media = SessionMedia(
+        media_store,
+        session_bytes=st.secrets.get("SESSION_MEDIA_MB", DEFAULT_SESSION_BYTES // MB) * MB,
+        total_bytes=st.secrets.get("SESSION_MEDIA_TOTAL_MB", DEFAULT_TOTAL_BYTES // MB) * MB,
+        expire_seconds=st.secrets.get("MEDIA_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+    )
+    media.start_sweeper()
+    return media
+
+session_media = get_session_media()
+
+@st.cache_resource
+def get_asset_store():
+    """Returns the store for static app assets; they never expire"""
+    return MediaStore(os.path.join(DATA_DIR, 'static', 'assets'), url_prefix='app/static/assets', ttl_seconds=None)
+
+@st.cache_resource
+def get_logo_html():
+    """Publishes the logo once per process, returns its <picture> markup"""
+    asset_store = get_asset_store()
+    png = asset_store.save_file(os.path.join(APP_DIR, 'logi.png'), 'png', 'image/png')
+    # Browsers that support AVIF pick the 4x smaller file
+    sources = ''
+    avif_path = os.path.join(APP_DIR, 'logi.avif')
+    if os.path.exists(avif_path):
+        avif = asset_store.save_file(avif_path, 'avif', 'image/avif')
+        sources = f'<source srcset="{asset_store.url(avif)}" type="image/avif">'
+    return f"""
+    <div style='text-align: center; margin-bottom: 20px;'>
+        <picture>{sources}<img src="{asset_store.url(png)}" alt="Logo" style="max-width: 150px; width: 100%;"></picture>
+    </div>
+    """
+
+# Result cache in front of both model call sites: identical requests reuse
+# stored outputs instead of starting a new paid prediction
+@st.cache_resource
+def get_result_cache():
+    """Returns the process-wide prediction result cache"""
+    return ResultCache(
+        os.path.join(DATA_DIR, '.cache', 'results'),
+        max_bytes=st.secrets.get("RESULT_CACHE_MAX_MB", DEFAULT_CACHE_BYTES // MB) * MB,
+    )
+
+result_cache = get_result_cache()
+
+# Generation history: every finished generation with its prompt, inputs
+# digest, outputs and thumbnails, kept across sessions and restarts
+@st.cache_resource
+def get_history():
+    """Returns the process-wide generation history"""
+    store = MediaStore(
+        os.path.join(DATA_DIR, 'static', 'history'),
+        url_prefix='app/static/history',
+        ttl_seconds=None,
+        max_bytes=st.secrets.get("HISTORY_MAX_MB", DEFAULT_HISTORY_BYTES // MB) * MB,
+    )
+    os.makedirs(os.path.join(DATA_DIR, '.cache'), exist_ok=True)
+    return History(os.path.join(DATA_DIR, '.cache', 'history.sqlite3'), store)
+
+history = get_history()
+
+# Initialize Replicate API; replicate itself is imported on the first prediction
 try:
-    replicate_client = replicate.Client(api_token=st.secrets["REPLICATE_API_TOKEN"])
+    replicate_client = LazyClient(api_token=st.secrets["REPLICATE_API_TOKEN"])
 except Exception as e:
     st.error("⚠️ Error connecting to Replicate API. Check your token in secrets.toml")
     st.stop()
 
+# Replicate limits per model, shared by all sessions: predictions queue
+# fairly for a slot instead of running into provider 429s
+@st.cache_resource
+def get_rate_governor():
+    """Configures the process-wide rate limiter from secrets.toml"""
+    configured = st.secrets.get("REPLICATE_LIMITS", {})
+    return limits.configure({model: limits.Limit(**values) for model, values in configured.items()})
+
+get_rate_governor()
+
+# Background jobs: predictions run on a shared worker pool, sessions keep job ids
+@st.cache_resource
+def get_job_manager(_client):
+    """Returns the process-wide prediction job manager"""
+    return JobManager(_client, max_workers=st.secrets.get("MAX_CONCURRENT_PREDICTIONS", DEFAULT_MAX_WORKERS))
+
+job_manager = get_job_manager(replicate_client)
+
+def get_session_id():
+    """Returns a stable id of this browser session for fair queueing"""
+    return st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+def track_job(session_key, job_id):
+    """Remembers a submitted job in session state and in the page URL"""
+    st.session_state[session_key] = job_id
+    # A refreshed page starts a new session; the URL lets it re-attach to
+    # the running job instead of submitting the generation again
+    st.query_params[session_key] = job_id
+
+def forget_job(session_key):
+    st.session_state.pop(session_key, None)
+    if session_key in st.query_params:
+        del st.query_params[session_key]
+
+def get_session_job(session_key):
+    """Returns the job referenced from session state or the URL, forgetting unknown ids"""
+    if session_key not in st.session_state and session_key in st.query_params:
+        st.session_state[session_key] = st.query_params[session_key]
+    job = job_manager.get(st.session_state.get(session_key))
+    if job is None and session_key in st.session_state:
+        forget_job(session_key)
+    return job
+
+def cancel_job(session_key):
+    """Button callback: stops following a job, cancels it unless other sessions share it"""
+    job_id = st.session_state.get(session_key)
+    if job_id is not None:
+        job_manager.cancel(job_id, get_session_id())
+    forget_job(session_key)
+    st.toast("Generation canceled")
+
+JOB_STATUS_LABELS = {
+    QUEUED: "queued",
+    STARTING: "starting (the model is booting)",
+    PROCESSING: "processing",
+}
+
+@st.fragment(run_every=2)
+def show_job_status(session_key, message):
+    """Shows status, latest log line and partial results of a running job,
+    reruns the app once it has finished"""
+    job = job_manager.get(st.session_state.get(session_key))
+    if job is None or job.done:
+        st.rerun()
+    if job.queue_position:
+        st.info(f"{message}\n\nWaiting for a free model slot: **#{job.queue_position}** in queue · {job.elapsed:.0f} s")
+    else:
+        status = JOB_STATUS_LABELS.get(job.status, job.status)
+        st.info(f"{message}\n\nStatus: **{status}** · {job.elapsed:.0f} s")
+    log_lines = job.logs.strip().splitlines()
+    if log_lines:
+        st.caption(f"📝 {log_lines[-1][:200]}")
+
+    # Results that finished downloading while the rest is still running
+    partial = job.partial_results()
+    if partial:
+        cols = st.columns(min(len(partial), MAX_RESULT_IMAGES))
+        for idx, encoded in enumerate(partial):
+            with cols[idx % len(cols)]:
+                st.image(encoded.data, width=300)
+                st.caption(f"Result {idx + 1} ready")
+    st.caption("You can leave this page open or refresh it; the generation keeps running.")
+    st.button("✖️ Cancel", key=f"cancel_{session_key}", on_click=cancel_job, args=(session_key,))
+
+def process_result(url, encoding=DEFAULT_DOWNLOAD_ENCODING, model="google/nano-banana"):
+    """Downloads one result image as soon as its URL is known"""
+    # Results that already are 1080x1920 keep their original bytes
+    return fetch_and_process(str(url), lambda data: run_in_pool(prepare_output, data, encoding), model)
+
+def collect_results(futures):
+    """Waits for the result images being processed, returns (encoded images, errors)"""
+    if not futures:
+        return None
+    images = []
+    errors = []
+    for future in futures:
+        try:
+            images.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    return images, errors
+
+def store_results(images):
+    """Replaces the session's result images in session media, returns their MediaRefs"""
+    session_id = get_session_id()
+    session_media.drop(session_id, [ref.name for ref in st.session_state.get('generated_images', [])])
+    return [session_media.put(session_id, f"result_{idx}", img.data, img.encoding.extension,
+                              img.encoding.mime, img.encoding.format)
+            for idx, img in enumerate(images)]
+
+def put_wan_input(source, encoded):
+    """Stores the WAN input image in session media once per source and encoding"""
+    if st.session_state.get('wan_input_source') == source and 'wan_input_image' in st.session_state:
+        return
+    st.session_state['wan_input_image'] = session_media.put(
+        get_session_id(), 'wan_input', encoded.data, encoded.encoding.extension, encoded.encoding.mime)
+    st.session_state['wan_input_source'] = source
+
+def video_output_url(output):
+    """Returns the provider URL of the WAN result video"""
+    # Output is URL (or list of URLs)
+    if isinstance(output, list):
+        output = output[0]
+    return str(output)
+
+def store_video(output, model="wan-video/wan-2.2-i2v-fast"):
+    """Streams the WAN result video into the media store"""
+    if not output:
+        return None
+    return fetch_to_store(video_output_url(output), media_store, 'mp4', 'video/mp4', model=model)
+
+def history_thumbnail(data):
+    """Renders a gallery thumbnail on the image pool, or returns None if it is busy"""
+    try:
+        return run_in_pool(render_thumbnail, data, THUMBNAIL_SIZE)
+    except PoolBusy:
+        return None
+
+def record_history(job, key, outputs, previews):
+    """Adds a finished generation to the history in the background.
+
+    Thumbnails (rendered from previews) and file copies happen on the
+    download pool, so they never delay the result the session waits for.
+    """
+    prompt = job.input.get('prompt', '')
+    timings = {stage: round(seconds, 3) for stage, seconds in job.timings.items()}
+
+    def record():
+        outputs_with_thumbnails = [
+            replace(output, thumbnail=history_thumbnail(preview) if preview is not None else None)
+            for output, preview in zip(outputs, previews)
+        ]
+        history.record(job.model, prompt, key, outputs_with_thumbnails, timings)
+
+    get_executor().submit(record)
+
+def cache_images(key):
+    """Returns on_success hook that stores result images in the result cache and the history"""
+    def store(job):
+        if job.result and job.result[0]:
+            images, errors = job.result
+            # A result short of images that failed to download must not
+            # answer later identical requests
+            if not errors:
+                blobs = [(img.encoding.extension, img.data) for img in images]
+                result_cache.put(key, blobs, {'model': job.model, 'seconds': job.timings['total']})
+            record_history(job, key,
+                           [HistoryOutput(img.encoding.extension, img.encoding.mime, img.data) for img in images],
+                           [img.data for img in images])
+    return store
+
+def load_cached_images(entry):
+    """Returns cached result in the same shape as download_results"""
+    images = []
+    for path in entry.paths:
+        with open(path, 'rb') as f:
+            images.append(from_bytes(f.read()))
+    return images, []
+
+def cache_video(key, preview=None):
+    """Returns on_success hook that stores the result video in the result cache and the history.
+
+    preview is a small image of the input for the history thumbnail;
+    without it the thumbnail is rendered from the input image.
+    """
+    def store(job):
+        if job.result is not None:
+            blobs = [('mp4', media_store.path(job.result))]
+            # The provider URL lets cache hits stream the video while it is valid
+            result_cache.put(key, blobs, {'model': job.model, 'seconds': job.timings['total'],
+                                          'output': video_output_url(job.output),
+                                          'output_expires': job.output_expires})
+            # Videos are not decoded; the input image stands in as their thumbnail
+            thumbnail_source = preview
+            if thumbnail_source is None and 'image' in job.input:
+                thumbnail_source = job.input['image'].getvalue()
+            record_history(job, key, [HistoryOutput('mp4', 'video/mp4', media_store.path(job.result))],
+                           [thumbnail_source])
+    return store
+
+def load_cached_video(entry):
+    """Copies cached video into the media store, returns its handle"""
+    return media_store.save_file(entry.paths[0], 'mp4', 'video/mp4')
+
+def submit_generation(model, input_data, postprocess, cache_result, load_cached, on_item=None, max_items=None,
+                      output=None):
+    """Returns job id for a generation, reusing the cached result of identical inputs.
+
+    output lists the settings that on_item and postprocess apply to the
+    results (e.g. the download encoding); they are part of the key.
+    """
+    key = make_key(model, input_data, output)
+    entry = result_cache.get(key)
+    metrics.CACHE_LOOKUPS.inc(result='hit' if entry is not None else 'miss', model=model)
+    if entry is not None:
+        return job_manager.add_completed(
+            model, load_cached(entry), timings={'saved': entry.meta.get('seconds', 0.0)},
+            output=entry.meta.get('output'), output_expires=entry.meta.get('output_expires')
+        )
+    # Identical generations already running (another session, a double
+    # click) are joined instead of paying for a second prediction
+    return job_manager.submit(model, input_data, postprocess=postprocess, on_success=cache_result(key),
+                              session=get_session_id(), key=key, on_item=on_item, max_items=max_items)
+
+def show_image_error(error_message):
+    """Shows image generation error with possible causes"""
+    st.error(f"❌ Generation error: {error_message}")
+
+    st.info("""
+    **Possible error causes:**
+    - Check REPLICATE_API_TOKEN is correct
+    - Ensure google/nano-banana model is available
+    - Check input data format (model schema)
+    - API limit may be exhausted
+    """)
+
+def show_video_error(error_message):
+    """Shows video generation error with possible causes"""
+    st.error(f"❌ Video generation error: {error_message}")
+    st.info("""
+    **Possible causes:**
+    - Check REPLICATE_API_TOKEN
+    - Ensure wan-video/wan-2.2-i2v-fast model is available
+    - Check API limits
+    """)
+
+# Batch generation: runs are shared by the process and keyed by manifest digest,
+# so re-uploading the same manifest resumes it instead of starting over
+@st.cache_resource
+def get_batch_runs():
+    """Returns process-wide registry of batch runs"""
+    return {}
+
+def start_batch(manifest_file):
+    """Starts (or resumes) a batch from an uploaded CSV/ZIP manifest, returns its id"""
+    data = manifest_file.getvalue()
+    batch_id = hashlib.sha256(data).hexdigest()[:16]
+    batch_runs = get_batch_runs()
+    if batch_id in batch_runs and not batch_runs[batch_id].finished:
+        return batch_id
+
+    batch_dir = os.path.join(DATA_DIR, '.cache', 'batches', batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
+    manifest_path = os.path.join(batch_dir, 'upload' + os.path.splitext(manifest_file.name)[1].lower())
+    with open(manifest_path, 'wb') as f:
+        f.write(data)
+    rows, base_dir = read_manifest(manifest_path, work_dir=batch_dir)
+
+    def write_archive(runner):
+        # Kept in the batch directory: static serving refuses files over
+        # 200 MB, and the shared media store would evict other sessions' media
+        runner.archive_path = runner.archive(os.path.join(batch_dir, 'results.zip'))
+
+    runner = BatchRunner(
+        replicate_client,
+        batch_dir,
+        concurrency=st.secrets.get("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY),
+        model_encoding=model_encoding,
+        output_encoding=download_encoding,
+        # Manifests come from visitors: their image URLs may only reach public hosts
+        public_urls_only=True
+    )
+    runner.archive_path = None
+    runner.run_in_background(rows, base_dir, on_finished=write_archive)
+    batch_runs[batch_id] = runner
+    return batch_id
+
+@st.fragment(run_every=2)
+def show_batch_progress(batch_id):
+    """Shows progress of a running batch, reruns the app once it has finished"""
+    runner = get_batch_runs().get(batch_id)
+    if runner is None or runner.finished:
+        st.rerun()
+    done = runner.succeeded + runner.failed
+    st.progress(done / runner.total if runner.total else 0.0,
+                text=f"{done}/{runner.total} rows done · {runner.failed} failed")
+
 # Title
 st.title("🐱 CAT REFACER")
 st.markdown("### AI-Powered 9:16 Image Generator")
@@ -243,179 +567,220 @@ st.markdown("Upload up to 2 reference images and describe your desired result. A
 with st.sidebar:
     # Logo at the top of sidebar
     try:
-        import base64
-        with open('logi.png', 'rb') as f:
-            logo_data = base64.b64encode(f.read()).decode()
-        st.markdown(f"""
-        <div style='text-align: center; margin-bottom: 20px;'>
-            <img src="data:image/png;base64,{logo_data}" alt="Logo" style="max-width: 150px; width: 100%;">
-        </div>
-        """, unsafe_allow_html=True)
-    except:
+        st.markdown(get_logo_html(), unsafe_allow_html=True)
+    except OSError:
         pass  # Logo not found
 
-# Main area - image upload
-st.subheader("📤 Upload Reference Images")
+    # Result cache effectiveness
+    with st.expander("📊 Result Cache"):
+        cache_stats = result_cache.stats()
+        prediction_costs = st.secrets.get("PREDICTION_COST_USD", {})
+        saved_spend = sum(count * prediction_costs.get(model, 0.0)
+                          for model, count in cache_stats['saved_predictions'].items())
+        st.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+        st.caption(
+            f"{cache_stats['hits']} hits / {cache_stats['hits'] + cache_stats['misses']} lookups · "
+            f"saved {cache_stats['saved_seconds']:.0f} s of waiting and "
+            f"{sum(cache_stats['saved_predictions'].values())} predictions"
+            + (f" (≈ ${saved_spend:.2f})" if saved_spend else "")
+            + f" · {cache_stats['entries']} entries, {format_size(cache_stats['bytes'])}"
+        )
 
-col1, col2 = st.columns(2)
-
-# Initialize image variables
-image_1 = None
-image_2 = None
-uploaded_file_1 = None
-uploaded_file_2 = None
-
-with col1:
-    st.markdown("#### Image 1 (Required)")
-    uploaded_file_1 = st.file_uploader(
-        "Choose first image",
-        type=['png', 'jpg', 'jpeg', 'webp'],
-        help="Upload first reference image - will be converted to 9:16 format",
-        key="uploader_1",
-        label_visibility="collapsed"
-    )
-    if uploaded_file_1 is not None:
-        try:
-            image_1 = Image.open(uploaded_file_1)
-            image_1 = fix_image_orientation(image_1)
-
-            # Crop position selector
-            st.markdown("**Crop Position:**")
-            width, height = image_1.size
-            target_ratio = 9 / 16
-            current_ratio = width / height
-
-            if current_ratio > target_ratio:
-                crop_pos_1 = st.radio(
-                    "Horizontal crop alignment",
-                    options=['left', 'center', 'right'],
-                    index=1,
-                    key="crop_pos_1",
-                    horizontal=True
-                )
-            elif current_ratio < target_ratio:
-                crop_pos_1 = st.radio(
-                    "Vertical crop alignment",
-                    options=['top', 'center', 'bottom'],
-                    index=1,
-                    key="crop_pos_1",
-                    horizontal=True
-                )
-            else:
-                crop_pos_1 = 'center'
+    # Encoding settings: model inputs and downloads are chosen separately
+    with st.expander("⚙️ Image Encoding"):
+        encoding_names = list(ENCODINGS)
+        model_encoding = st.selectbox(
+            "Upload to model",
+            options=encoding_names,
+            index=get_setting_index(encoding_names, "MODEL_ENCODING", DEFAULT_MODEL_ENCODING),
+            format_func=lambda name: ENCODINGS[name].label,
+            key="model_encoding",
+            help="Format of images sent to Replicate"
+        )
+        download_encoding = st.selectbox(
+            "Download",
+            options=encoding_names,
+            index=get_setting_index(encoding_names, "DOWNLOAD_ENCODING", DEFAULT_DOWNLOAD_ENCODING),
+            format_func=lambda name: ENCODINGS[name].label,
+            key="download_encoding",
+            help="Format of images offered for download"
+        )
 
-            # Apply crop and show preview
-            cropped_1 = crop_to_9_16(image_1.copy(), crop_pos_1)
-            st.image(cropped_1, caption="Crop Preview (9:16)", use_column_width=True)
+def set_widget_value(key, value):
+    """Button callback that fills a widget, e.g. a prompt from an example"""
+    st.session_state[key] = value
 
-            # Save processed image
-            final_image_1 = resize_to_final(cropped_1)
-            buf = io.BytesIO()
-            final_image_1.save(buf, format='PNG')
-            buf.seek(0)
-            st.session_state['image_1'] = buf
+# The page is split into fragments: a widget change reruns only its own
+# section, not the CSS, sidebar and other sections. Sections share state
+# through session state: the reference images and crops
+# ('reference_images'), MediaRefs of results of the image section
+# ('generated_images') and running jobs. Encodings from the sidebar are
+# passed in; changing them reruns the whole page.
 
-        except Exception as e:
-            st.error(f"Error loading image 1: {e}")
-
-with col2:
-    st.markdown("#### Image 2 (Optional)")
-    uploaded_file_2 = st.file_uploader(
-        "Choose second image",
-        type=['png', 'jpg', 'jpeg', 'webp'],
-        help="Upload second reference image - will be converted to 9:16 format",
-        key="uploader_2",
-        label_visibility="collapsed"
-    )
-    if uploaded_file_2 is not None:
-        try:
-            image_2 = Image.open(uploaded_file_2)
-            image_2 = fix_image_orientation(image_2)
-
-            # Crop position selector
-            st.markdown("**Crop Position:**")
-            width, height = image_2.size
-            target_ratio = 9 / 16
-            current_ratio = width / height
-
-            if current_ratio > target_ratio:
-                crop_pos_2 = st.radio(
-                    "Horizontal crop alignment",
-                    options=['left', 'center', 'right'],
-                    index=1,
-                    key="crop_pos_2",
-                    horizontal=True
-                )
-            elif current_ratio < target_ratio:
-                crop_pos_2 = st.radio(
-                    "Vertical crop alignment",
-                    options=['top', 'center', 'bottom'],
-                    index=1,
-                    key="crop_pos_2",
-                    horizontal=True
-                )
-            else:
-                crop_pos_2 = 'center'
+# Main area - image upload
+st.subheader("📤 Upload Reference Images")
 
-            # Apply crop and show preview
-            cropped_2 = crop_to_9_16(image_2.copy(), crop_pos_2)
-            st.image(cropped_2, caption="Crop Preview (9:16)", use_column_width=True)
+@st.fragment
+def reference_images_section():
+    """Upload and crop preview of the reference images"""
+    col1, col2 = st.columns(2)
+
+    # Initialize image variables
+    image_1 = None
+    image_2 = None
+    uploaded_file_1 = None
+    uploaded_file_2 = None
+    crop_pos_1 = 'center'
+    crop_pos_2 = 'center'
+
+    with col1:
+        st.markdown("#### Image 1 (Required)")
+        uploaded_file_1 = st.file_uploader(
+            "Choose first image",
+            type=['png', 'jpg', 'jpeg', 'webp'],
+            help="Upload first reference image - will be converted to 9:16 format",
+            key="uploader_1",
+            label_visibility="collapsed"
+        )
+        if uploaded_file_1 is not None:
+            try:
+                digest_1 = get_upload_digest(uploaded_file_1)
+                upload_data_1 = uploaded_file_1.getvalue()
+
+                # Crop position selector
+                st.markdown("**Crop Position:**")
+                width, height = get_upload_size(digest_1, upload_data_1)
+                target_ratio = 9 / 16
+                current_ratio = width / height
+
+                if current_ratio > target_ratio:
+                    crop_pos_1 = st.radio(
+                        "Horizontal crop alignment",
+                        options=['left', 'center', 'right'],
+                        index=1,
+                        key="crop_pos_1",
+                        horizontal=True
+                    )
+                elif current_ratio < target_ratio:
+                    crop_pos_1 = st.radio(
+                        "Vertical crop alignment",
+                        options=['top', 'center', 'bottom'],
+                        index=1,
+                        key="crop_pos_1",
+                        horizontal=True
+                    )
+                else:
+                    crop_pos_1 = 'center'
 
-            # Save processed image
-            final_image_2 = resize_to_final(cropped_2)
-            buf = io.BytesIO()
-            final_image_2.save(buf, format='PNG')
-            buf.seek(0)
-            st.session_state['image_2'] = buf
+                # Show low-resolution crop preview; full render happens on generate
+                preview_1 = get_crop_preview(digest_1, crop_pos_1, upload_data_1)
+                st.image(preview_1, caption="Crop Preview (9:16)", use_column_width=True)
+                image_1 = uploaded_file_1
 
-        except Exception as e:
-            st.error(f"Error loading image 2: {e}")
+            except Exception as e:
+                st.error(f"Error loading image 1: {e}")
 
-# Prompt
-st.subheader("✍️ Describe Your Desired Result")
+    with col2:
+        st.markdown("#### Image 2 (Optional)")
+        uploaded_file_2 = st.file_uploader(
+            "Choose second image",
+            type=['png', 'jpg', 'jpeg', 'webp'],
+            help="Upload second reference image - will be converted to 9:16 format",
+            key="uploader_2",
+            label_visibility="collapsed"
+        )
+        if uploaded_file_2 is not None:
+            try:
+                digest_2 = get_upload_digest(uploaded_file_2)
+                upload_data_2 = uploaded_file_2.getvalue()
+
+                # Crop position selector
+                st.markdown("**Crop Position:**")
+                width, height = get_upload_size(digest_2, upload_data_2)
+                target_ratio = 9 / 16
+                current_ratio = width / height
+
+                if current_ratio > target_ratio:
+                    crop_pos_2 = st.radio(
+                        "Horizontal crop alignment",
+                        options=['left', 'center', 'right'],
+                        index=1,
+                        key="crop_pos_2",
+                        horizontal=True
+                    )
+                elif current_ratio < target_ratio:
+                    crop_pos_2 = st.radio(
+                        "Vertical crop alignment",
+                        options=['top', 'center', 'bottom'],
+                        index=1,
+                        key="crop_pos_2",
+                        horizontal=True
+                    )
+                else:
+                    crop_pos_2 = 'center'
 
-prompt = st.text_area(
-    "Generation Prompt:",
-    placeholder="Example: Make the sheets in the style of the logo. Make the scene natural.",
-    height=120,
-    help="Describe in detail what you want to achieve"
-)
+                # Show low-resolution crop preview; full render happens on generate
+                preview_2 = get_crop_preview(digest_2, crop_pos_2, upload_data_2)
+                st.image(preview_2, caption="Crop Preview (9:16)", use_column_width=True)
+                image_2 = uploaded_file_2
 
-# Prompt examples
-with st.expander("📝 Prompt Examples"):
-    examples = [
-        "Make the sheets in the style of the logo. Make the scene natural.",
-        "Combine these images in cyberpunk style with neon lighting",
-        "Apply the style of the first image to the second one",
-        "Create a photorealistic composition with dramatic lighting",
-        "Merge these images in vintage 1970s photography style"
-    ]
-    for idx, example in enumerate(examples):
-        if st.button(example, key=f"example_{idx}"):
-            st.session_state['prompt_text'] = example
-            st.rerun()
-
-# Apply example prompt if selected
-if 'prompt_text' in st.session_state and st.session_state['prompt_text']:
-    prompt = st.session_state['prompt_text']
-
-# Generate button
-st.divider()
-generate_button = st.button(
-    "🚀 Generate Image",
-    type="primary",
-    use_container_width=True,
-    disabled=(image_1 is None)
-)
+            except Exception as e:
+                st.error(f"Error loading image 2: {e}")
+
+    # The generation section reads the references from session state; it
+    # needs a full rerun only when an image was added or removed
+    previous = st.session_state.get('reference_images')
+    st.session_state['reference_images'] = (image_1, crop_pos_1, image_2, crop_pos_2)
+    if previous is not None and (previous[0] is None, previous[2] is None) != (image_1 is None, image_2 is None):
+        st.rerun()
+
+reference_images_section()
+
+@st.fragment
+def image_generation_section(model_encoding, download_encoding):
+    """Prompt, generation and results of the image model"""
+    image_1, crop_pos_1, image_2, crop_pos_2 = st.session_state['reference_images']
+
+    # Prompt
+    st.subheader("✍️ Describe Your Desired Result")
+
+    prompt = st.text_area(
+        "Generation Prompt:",
+        placeholder="Example: Make the sheets in the style of the logo. Make the scene natural.",
+        height=120,
+        key="prompt",
+        help="Describe in detail what you want to achieve"
+    )
 
-# Generation processing
-if generate_button:
-    if not prompt or len(prompt.strip()) < 5:
-        st.warning("⚠️ Please enter a description (minimum 5 characters)")
-    elif image_1 is None:
-        st.warning("⚠️ Upload at least one image")
-    else:
-        with st.spinner("🎨 Generating image... This may take 20-40 seconds..."):
+    # Prompt examples
+    with st.expander("📝 Prompt Examples"):
+        examples = [
+            "Make the sheets in the style of the logo. Make the scene natural.",
+            "Combine these images in cyberpunk style with neon lighting",
+            "Apply the style of the first image to the second one",
+            "Create a photorealistic composition with dramatic lighting",
+            "Merge these images in vintage 1970s photography style"
+        ]
+        for idx, example in enumerate(examples):
+            # The callback fills the prompt before the section reruns
+            st.button(example, key=f"example_{idx}", on_click=set_widget_value, args=("prompt", example))
+
+    # Generate button
+    st.divider()
+    generate_button = st.button(
+        "🚀 Generate Image",
+        type="primary",
+        use_container_width=True,
+        disabled=(image_1 is None)
+    )
+
+    # Generation processing
+    if generate_button:
+        if not prompt or len(prompt.strip()) < 5:
+            st.warning("⚠️ Please enter a description (minimum 5 characters)")
+        elif image_1 is None:
+            st.warning("⚠️ Upload at least one image")
+        else:
             try:
                 # Prepare input data for Replicate
                 input_data = {
@@ -423,101 +788,146 @@ if generate_button:
                     "image_input": []
                 }
 
-                # Add images to array
-                if 'image_1' in st.session_state:
-                    st.session_state['image_1'].seek(0)
-                    input_data["image_input"].append(st.session_state['image_1'])
-
-                if 'image_2' in st.session_state and image_2 is not None:
-                    st.session_state['image_2'].seek(0)
-                    input_data["image_input"].append(st.session_state['image_2'])
+                # Add images to array (full-resolution render happens here)
+                encoded_inputs = [get_final_image(image_1, crop_pos_1, model_encoding)]
 
-                # Run model on Replicate
-                output = replicate_client.run(
-                    "google/nano-banana",
-                    input=input_data
-                )
+                if image_2 is not None:
+                    encoded_inputs.append(get_final_image(image_2, crop_pos_2, model_encoding))
 
-                # Process result
-                # output can be URL or list of URLs
-                if output:
-                    generated_images = []
-
-                    # If output is a string (single URL)
-                    if isinstance(output, str):
-                        output = [output]
-
-                    # Limit to 3 images maximum
-                    output = output[:3]
-
-                    # Load images from URLs
-                    for img_url in output:
-                        try:
-                            response = requests.get(img_url)
-                            img = Image.open(io.BytesIO(response.content))
-                            # Apply processing to generated images
-                            img = fix_image_orientation_and_resize(img)
-                            generated_images.append(img)
-                        except Exception as e:
-                            st.warning(f"Failed to load image: {e}")
-
-                    if generated_images:
-                        st.session_state['generated_images'] = generated_images
-
-                        # Counter
-                        if 'generated_count' not in st.session_state:
-                            st.session_state['generated_count'] = 0
-                        st.session_state['generated_count'] += len(generated_images)
-
-                        st.success(f"✅ Successfully generated {len(generated_images)} image(s) in 9:16 format!")
-                    else:
-                        st.error("❌ Failed to get images from response")
-                else:
-                    st.error("❌ Model returned no result")
+                for idx, encoded in enumerate(encoded_inputs):
+                    input_data["image_input"].append(encoded.to_buffer(f"image_{idx + 1}"))
 
+                # Submit model run to the background job queue (or reuse cached result)
+                # Each result image is downloaded as soon as its URL appears
+                track_job('image_job', submit_generation(
+                    "google/nano-banana",
+                    input_data,
+                    postprocess=collect_results,
+                    cache_result=cache_images,
+                    load_cached=load_cached_images,
+                    on_item=lambda url: process_result(url, download_encoding),
+                    max_items=MAX_RESULT_IMAGES,
+                    output={'encoding': download_encoding}
+                ))
+                st.session_state['image_job_encoding'] = format_encode_stats(encoded_inputs)
+
+            except PoolBusy as e:
+                st.warning(f"⏳ {e}")
             except Exception as e:
-                error_message = str(e)
-                st.error(f"❌ Generation error: {error_message}")
-
-                st.info("""
-                **Possible error causes:**
-                - Check REPLICATE_API_TOKEN is correct
-                - Ensure google/nano-banana model is available
-                - Check input data format (model schema)
-                - API limit may be exhausted
-                """)
-
-# Display results
-if 'generated_images' in st.session_state and st.session_state['generated_images']:
-    st.divider()
-    st.subheader("🖼️ Generated Images")
-    st.markdown("**Image Format: 9:16 (1080x1920)**")
+                show_image_error(str(e))
+
+    # Collect finished image generation, or show its progress
+    image_job = get_session_job('image_job')
+    if image_job is not None and image_job.done:
+        forget_job('image_job')
+        if image_job.status != SUCCEEDED:
+            show_image_error(image_job.error)
+        elif image_job.result is None:
+            st.error("❌ Model returned no result")
+        else:
+            generated_images, errors = image_job.result
+            for error in errors:
+                st.warning(f"Failed to load image: {error}")
 
-    # Display in columns (maximum 3)
-    num_cols = min(len(st.session_state['generated_images']), 3)
-    cols = st.columns(num_cols)
+            stats = [format_job_timings(image_job)]
+            if 'image_job_encoding' in st.session_state:
+                stats.insert(0, st.session_state.pop('image_job_encoding'))
+            st.session_state['generation_stats'] = " · ".join(stats)
 
-    for idx, img in enumerate(st.session_state['generated_images']):
-        with cols[idx % num_cols]:
-            # Display image with fixed width for 9:16 format
-            st.image(img, caption=f"Result {idx + 1} (9:16)", width=300)
+            if generated_images:
+                st.session_state['generated_images'] = store_results(generated_images)
 
-            # Download button
-            buf = io.BytesIO()
-            img.save(buf, format='PNG')
-            byte_data = buf.getvalue()
+                # Counter
+                if 'generated_count' not in st.session_state:
+                    st.session_state['generated_count'] = 0
+                st.session_state['generated_count'] += len(generated_images)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"nano_banana_9x16_{timestamp}_{idx + 1}.png"
-
-            st.download_button(
-                label="⬇️ Download PNG",
-                data=byte_data,
-                file_name=filename,
-                mime="image/png",
-                key=f"download_result_{idx}",
-                use_container_width=True
-            )
+                st.success(f"✅ Successfully generated {len(generated_images)} image(s) in 9:16 format!")
+            else:
+                st.error("❌ Failed to get images from response")
+    elif image_job is not None:
+        show_job_status('image_job', "🎨 Generating image... This may take 20-40 seconds...")
+
+    # Display results
+    if st.session_state.get('generated_images'):
+        st.divider()
+        st.subheader("🖼️ Generated Images")
+        st.markdown("**Image Format: 9:16 (1080x1920)**")
+        if 'generation_stats' in st.session_state:
+            st.caption(st.session_state['generation_stats'])
+
+        # Results are served from the media store by immutable URL; session
+        # media writes them there on first use
+        result_refs = st.session_state['generated_images']
+        result_media = [session_media.handle(ref) for ref in result_refs]
+
+        if None in result_media:
+            # Spilled and then cleaned up by the media store
+            st.info("Generated images have expired, please generate them again.")
+            del st.session_state['generated_images']
+        else:
+            # Display in columns (maximum 3)
+            num_cols = min(len(result_refs), 3)
+            cols = st.columns(num_cols)
+
+            for idx, (ref, handle) in enumerate(zip(result_refs, result_media)):
+                with cols[idx % num_cols]:
+                    # Display image with fixed width for 9:16 format
+                    result_url = media_store.url(handle)
+                    st.markdown(f"""
+                    <img src="{result_url}" alt="Result {idx + 1}" style="width: 300px; max-width: 100%;">
+                    """, unsafe_allow_html=True)
+                    st.caption(f"Result {idx + 1} (9:16)")
+
+                    # Download link to the same file
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    filename = f"nano_banana_9x16_{timestamp}_{idx + 1}.{ref.extension}"
+                    st.markdown(f"""
+                    <a class="media-download" href="{result_url}" download="{filename}">⬇️ Download {ref.label}</a>
+                    """, unsafe_allow_html=True)
+
+image_generation_section(model_encoding, download_encoding)
+
+# Batch generation
+@st.fragment
+def batch_section():
+    with st.expander("📦 Batch Generation"):
+        st.markdown("""
+        Upload a **CSV manifest** (images as URLs) or a **ZIP** with `manifest.csv` and the images.
+        One row per generation, columns: `id` (optional), `prompt`, `image_1`, `crop_1`, `image_2`, `crop_2`.
+        Rows run in parallel through the same 9:16 pipeline; uploading the same manifest again resumes it.
+        """)
+        manifest_file = st.file_uploader(
+            "Batch manifest",
+            type=['csv', 'zip'],
+            key="batch_manifest",
+            label_visibility="collapsed"
+        )
+        if st.button("▶️ Run Batch", disabled=(manifest_file is None), key="batch_run"):
+            try:
+                st.session_state['batch_id'] = start_batch(manifest_file)
+            except ManifestError as e:
+                st.error(f"❌ Invalid manifest: {e}")
+
+        batch_runner = get_batch_runs().get(st.session_state.get('batch_id'))
+        if batch_runner is not None and not batch_runner.finished:
+            show_batch_progress(st.session_state['batch_id'])
+        elif batch_runner is not None:
+            if batch_runner.error:
+                st.error(f"❌ Batch error: {batch_runner.error}")
+            else:
+                st.success(f"✅ Batch finished: {batch_runner.succeeded}/{batch_runner.total} rows succeeded, {batch_runner.failed} failed")
+            if batch_runner.archive_path is not None and os.path.exists(batch_runner.archive_path):
+                with open(batch_runner.archive_path, 'rb') as archive:
+                    st.download_button(
+                        "⬇️ Download Results (ZIP)",
+                        data=archive,
+                        file_name=f"batch_{st.session_state['batch_id']}.zip",
+                        mime="application/zip",
+                        key="batch_download"
+                    )
+
+batch_section()
 
 # Information block
 with st.expander("ℹ️ How It Works"):
@@ -551,171 +961,260 @@ st.divider()
 st.header("🎬 Image-to-Video Generation")
 st.markdown("Transform your static images into dynamic videos using AI-powered motion.")
 
-wan_col1, wan_col2 = st.columns([1, 1])
+@st.fragment
+def wan_section(model_encoding):
+    """Input image, motion prompt, generation and result of the WAN video"""
+    wan_col1, wan_col2 = st.columns([1, 1])
 
-with wan_col1:
-    st.subheader("📷 Input Image")
+    with wan_col1:
+        st.subheader("📷 Input Image")
 
-    wan_image_source = st.radio(
-        "Choose image source:",
-        options=["Upload new image", "Use generated image from above"],
-        key="wan_image_source"
-    )
+        wan_image_source = st.radio(
+            "Choose image source:",
+            options=["Upload new image", "Use generated image from above"],
+            key="wan_image_source"
+        )
 
-    wan_input_image = None
+        wan_input_image = None
+        wan_preview = None
 
-    if wan_image_source == "Upload new image":
-        wan_uploaded = st.file_uploader(
-            "Upload image for video generation",
-            type=['png', 'jpg', 'jpeg', 'webp'],
-            key="wan_uploader"
-        )
-        if wan_uploaded is not None:
-            wan_input_image = Image.open(wan_uploaded)
-            st.image(wan_input_image, caption="Input for video", use_column_width=True)
-
-            # Save to session state
-            buf = io.BytesIO()
-            wan_input_image.save(buf, format='PNG')
-            buf.seek(0)
-            st.session_state['wan_input_image'] = buf
-    else:
-        if 'generated_images' in st.session_state and st.session_state['generated_images']:
-            selected_idx = st.selectbox(
-                "Select generated image:",
-                options=range(len(st.session_state['generated_images'])),
-                format_func=lambda x: f"Result {x + 1}"
+        if wan_image_source == "Upload new image":
+            wan_uploaded = st.file_uploader(
+                "Upload image for video generation",
+                type=['png', 'jpg', 'jpeg', 'webp'],
+                key="wan_uploader"
             )
-            wan_input_image = st.session_state['generated_images'][selected_idx]
-            st.image(wan_input_image, caption=f"Result {selected_idx + 1}", use_column_width=True)
-
-            # Save to session state
-            buf = io.BytesIO()
-            wan_input_image.save(buf, format='PNG')
-            buf.seek(0)
-            st.session_state['wan_input_image'] = buf
+            if wan_uploaded is not None:
+                try:
+                    wan_digest = get_upload_digest(wan_uploaded)
+                    wan_preview = get_upload_thumbnail(wan_digest, wan_uploaded.getvalue())
+                    st.image(wan_preview, caption="Input for video", use_column_width=True)
+
+                    # Save to session media (encoded upright once per upload and encoding,
+                    # so the model sees what the preview shows)
+                    source = ('upload', wan_digest, model_encoding)
+                    if st.session_state.get('wan_input_source') != source:
+                        put_wan_input(source, encode_upload(wan_digest, model_encoding, wan_uploaded.getvalue()))
+                    wan_input_image = wan_uploaded
+                except ImageTooLarge as e:
+                    st.error(f"❌ {e}")
+                except PoolBusy as e:
+                    st.warning(f"⏳ {e}")
         else:
-            st.info("No generated images available. Please generate images first or upload a new one.")
-
-with wan_col2:
-    st.subheader("✍️ Motion Prompt")
-
-    # WAN prompt examples
-    with st.expander("📝 Motion Prompt Examples"):
-        wan_examples = [
-            "The camera slowly zooms in, capturing gentle movements and atmospheric details",
-            "Smooth pan from left to right, revealing the scene gradually",
-            "Subtle movements - hair flowing in the wind, leaves rustling",
-            "Dynamic camera push-in with dramatic lighting changes",
-            "Circular camera movement around the subject with soft focus"
-        ]
-        for idx, example in enumerate(wan_examples):
-            if st.button(example, key=f"wan_example_{idx}"):
-                st.session_state['wan_prompt_value'] = example
-                st.rerun()
-
-    # Get default value from session state if available
-    default_wan_prompt = st.session_state.get('wan_prompt_value', '')
-
-    wan_prompt = st.text_area(
-        "Describe the desired motion:",
-        value=default_wan_prompt,
-        placeholder="Example: Close-up shot of an elderly sailor wearing a yellow raincoat, seated on the deck of a catamaran, slowly puffing on a pipe...",
-        height=150,
-        key="wan_prompt",
-        help="Describe the motion, camera movement, and atmosphere you want in the video"
-    )
+            if 'generated_images' in st.session_state and st.session_state['generated_images']:
+                selected_idx = st.selectbox(
+                    "Select generated image:",
+                    options=range(len(st.session_state['generated_images'])),
+                    format_func=lambda x: f"Result {x + 1}"
+                )
+                result_ref = st.session_state['generated_images'][selected_idx]
+                result_handle = session_media.handle(result_ref)
+                if result_handle is not None:
+                    wan_input_image = result_ref
+                    st.markdown(f"""
+                    <img src="{media_store.url(result_handle)}" alt="Result {selected_idx + 1}" style="width: 100%;">
+                    """, unsafe_allow_html=True)
+                    st.caption(f"Result {selected_idx + 1}")
+
+                    # Save to session media (re-encoded at most once per result and encoding)
+                    source = ('result', result_handle.name, model_encoding)
+                    if st.session_state.get('wan_input_source') != source:
+                        put_wan_input(source, from_bytes(session_media.get(result_ref)).reencode(model_encoding))
+                else:
+                    st.info("The generated image has expired, please generate it again or upload a new one.")
+            else:
+                st.info("No generated images available. Please generate images first or upload a new one.")
+
+    with wan_col2:
+        st.subheader("✍️ Motion Prompt")
+
+        # WAN prompt examples
+        with st.expander("📝 Motion Prompt Examples"):
+            wan_examples = [
+                "The camera slowly zooms in, capturing gentle movements and atmospheric details",
+                "Smooth pan from left to right, revealing the scene gradually",
+                "Subtle movements - hair flowing in the wind, leaves rustling",
+                "Dynamic camera push-in with dramatic lighting changes",
+                "Circular camera movement around the subject with soft focus"
+            ]
+            for idx, example in enumerate(wan_examples):
+                st.button(example, key=f"wan_example_{idx}", on_click=set_widget_value, args=("wan_prompt", example))
+
+        wan_prompt = st.text_area(
+            "Describe the desired motion:",
+            placeholder="Example: Close-up shot of an elderly sailor wearing a yellow raincoat, seated on the deck of a catamaran, slowly puffing on a pipe...",
+            height=150,
+            key="wan_prompt",
+            help="Describe the motion, camera movement, and atmosphere you want in the video"
+        )
 
-# Generate video button
-wan_generate_button = st.button(
-    "🎥 Generate Video",
-    type="primary",
-    use_container_width=True,
-    disabled=(wan_input_image is None),
-    key="wan_generate"
-)
+    # Generate video button
+    wan_generate_button = st.button(
+        "🎥 Generate Video",
+        type="primary",
+        use_container_width=True,
+        disabled=(wan_input_image is None),
+        key="wan_generate"
+    )
 
-if wan_generate_button:
-    if not wan_prompt or len(wan_prompt.strip()) < 10:
-        st.warning("⚠️ Please enter a motion description (minimum 10 characters)")
-    elif wan_input_image is None:
-        st.warning("⚠️ Please select or upload an image")
-    else:
-        with st.spinner("🎬 Generating video... This may take 60-120 seconds..."):
+    if wan_generate_button:
+        if not wan_prompt or len(wan_prompt.strip()) < 10:
+            st.warning("⚠️ Please enter a motion description (minimum 10 characters)")
+        elif wan_input_image is None:
+            st.warning("⚠️ Please select or upload an image")
+        else:
             try:
                 # Prepare input for WAN
-                st.session_state['wan_input_image'].seek(0)
+                wan_input_ref = st.session_state['wan_input_image']
+                wan_input_data = session_media.get(wan_input_ref)
+                if wan_input_data is None:
+                    st.session_state.pop('wan_input_source', None)
+                    raise ValueError("The input image has expired, please select it again")
+                wan_input_buffer = io.BytesIO(wan_input_data)
+                wan_input_buffer.name = f"wan_input.{wan_input_ref.extension}"
 
                 input_data = {
-                    "image": st.session_state['wan_input_image'],
+                    "image": wan_input_buffer,
                     "prompt": wan_prompt
                 }
 
-                # Run WAN model
-                output = replicate_client.run(
+                # Submit WAN model run to the background job queue (or reuse cached result)
+                track_job('wan_job', submit_generation(
                     "wan-video/wan-2.2-i2v-fast",
-                    input=input_data
-                )
-
-                if output:
-                    # Handle different output types
-                    if isinstance(output, str):
-                        # Output is URL, download the video
-                        video_response = requests.get(output)
-                        video_data = video_response.content
-                    else:
-                        # Output is FileOutput object, read it
-                        try:
-                            video_data = output.read()
-                        except AttributeError:
-                            # Try to get URL from output
-                            video_url = str(output)
-                            video_response = requests.get(video_url)
-                            video_data = video_response.content
-
-                    st.session_state['wan_video'] = video_data
-
-                    # Update counter
-                    if 'video_count' not in st.session_state:
-                        st.session_state['video_count'] = 0
-                    st.session_state['video_count'] += 1
-
-                    st.success("✅ Video generated successfully!")
-                else:
-                    st.error("❌ Failed to generate video")
+                    input_data,
+                    postprocess=store_video,
+                    cache_result=lambda key: cache_video(key, wan_preview),
+                    load_cached=load_cached_video
+                ))
 
             except Exception as e:
-                st.error(f"❌ Video generation error: {str(e)}")
-                st.info("""
-                **Possible causes:**
-                - Check REPLICATE_API_TOKEN
-                - Ensure wan-video/wan-2.2-i2v-fast model is available
-                - Check API limits
-                """)
-
-# Display generated video
-if 'wan_video' in st.session_state and st.session_state['wan_video']:
-    st.divider()
-    st.subheader("🎥 Generated Video")
-
-    video_col1, video_col2 = st.columns([2, 1])
-
-    with video_col1:
-        st.video(st.session_state['wan_video'])
-
-    with video_col2:
-        st.markdown("### 📥 Download")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        st.download_button(
-            label="⬇️ Download Video (MP4)",
-            data=st.session_state['wan_video'],
-            file_name=f"wan_video_{timestamp}.mp4",
-            mime="video/mp4",
-            use_container_width=True
-        )
+                show_video_error(str(e))
+
+    # Collect finished video generation, or show its progress
+    wan_job = get_session_job('wan_job')
+    if wan_job is not None and wan_job.done:
+        forget_job('wan_job')
+        if wan_job.status != SUCCEEDED:
+            show_video_error(wan_job.error)
+        elif wan_job.result is None:
+            st.error("❌ Failed to generate video")
+        else:
+            st.session_state['wan_video'] = wan_job.result
+            st.session_state['wan_video_stream'] = (
+                (video_output_url(wan_job.output), wan_job.output_expires)
+                if wan_job.output and wan_job.output_expires else None
+            )
+
+            # Update counter
+            if 'video_count' not in st.session_state:
+                st.session_state['video_count'] = 0
+            st.session_state['video_count'] += 1
+
+            st.success("✅ Video generated successfully!")
+            st.caption(format_job_timings(wan_job))
+    elif wan_job is not None:
+        show_job_status('wan_job', "🎬 Generating video... This may take 60-120 seconds...")
+
+    # Drop video handles whose files were cleaned up by TTL or size limit
+    if 'wan_video' in st.session_state and not media_store.exists(st.session_state['wan_video']):
+        del st.session_state['wan_video']
+        st.info("Your previous video has expired. Please generate it again.")
+
+    # Display generated video. Static serving sends .mp4 as text/plain with
+    # nosniff, which browsers refuse to play, and st.video on a file would
+    # keep a copy in server memory per viewer. The player streams from the
+    # provider's delivery URL while it is valid; the download link stays static
+    if 'wan_video' in st.session_state and st.session_state['wan_video']:
+        st.divider()
+        st.subheader("🎥 Generated Video")
+
+        video_url = media_store.url(st.session_state['wan_video'])
+        video_col1, video_col2 = st.columns([2, 1])
+
+        with video_col1:
+            stream = st.session_state.get('wan_video_stream')
+            if stream is not None and time.time() < stream[1] - VIDEO_STREAM_MARGIN_SECONDS:
+                st.video(stream[0], format="video/mp4")
+            else:
+                st.info("▶️ The online preview of this video has expired. Download it to watch.")
 
-        if 'video_count' in st.session_state:
-            st.metric("Videos Generated", st.session_state['video_count'])
+        with video_col2:
+            st.markdown("### 📥 Download")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            st.markdown(f"""
+            <a class="media-download" href="{video_url}" download="wan_video_{timestamp}.mp4">⬇️ Download Video (MP4)</a>
+            """, unsafe_allow_html=True)
+
+            if 'video_count' in st.session_state:
+                st.metric("Videos Generated", st.session_state['video_count'])
+
+wan_section(model_encoding)
+
+# ============================================================================
+# GENERATION HISTORY SECTION
+# ============================================================================
+st.divider()
+st.header("🗂️ Generation History")
+st.markdown("Everything generated so far, newest first. Search the prompts before generating something again.")
+
+@st.fragment
+def history_section():
+    """Paginated, searchable gallery of past generations; only thumbnails are loaded"""
+    filter_col1, filter_col2 = st.columns([2, 1])
+    with filter_col1:
+        query = st.text_input("Search prompts:", key="history_query",
+                              on_change=set_widget_value, args=("history_page", 1))
+    with filter_col2:
+        model = st.selectbox("Model:", options=[""] + history.models(), format_func=lambda m: m or "All models",
+                             key="history_model", on_change=set_widget_value, args=("history_page", 1))
+
+    page = st.session_state.get('history_page', 1)
+    entries, total = history.page(query.strip(), model or None, page - 1)
+    pages = max(1, -(-total // DEFAULT_PAGE_SIZE))
+    if page > pages:
+        page = st.session_state['history_page'] = pages
+        entries, total = history.page(query.strip(), model or None, page - 1)
+    if not total:
+        st.info("Nothing matches this search." if query or model else "No generations yet.")
+        return
+
+    page_col1, page_col2 = st.columns([1, 2])
+    with page_col1:
+        st.number_input("Page", min_value=1, max_value=pages, key="history_page")
+    with page_col2:
+        st.caption(f"{total} generation(s) · page {page} of {pages}")
+
+    num_cols = 4
+    for row_start in range(0, len(entries), num_cols):
+        cols = st.columns(num_cols)
+        for col, entry in zip(cols, entries[row_start:row_start + num_cols]):
+            with col:
+                prompt = html.escape(entry.prompt)
+                first_url = history.store.url(entry.outputs[0]) if entry.outputs else ''
+                is_video = bool(entry.outputs) and entry.outputs[0].mime.startswith('video/')
+                thumbnail = entry.thumbnails[0] if entry.thumbnails else None
+                if history.store.exists(thumbnail):
+                    preview = (f'<img src="{history.store.url(thumbnail)}" alt="{prompt}" loading="lazy" '
+                               f'style="width: 100%;">')
+                else:
+                    preview = "🎥" if is_video else "🖼️"
+                links = " · ".join(
+                    f'<a href="{history.store.url(output)}" download>{idx + 1}</a>'
+                    for idx, output in enumerate(entry.outputs) if history.store.exists(output)
+                )
+                # Static serving sends videos as text/plain, so they are
+                # downloaded rather than opened in a new tab
+                target = 'download' if is_video else 'target="_blank"'
+                created = datetime.fromtimestamp(entry.created_at).strftime("%Y-%m-%d %H:%M")
+                # One element per card: every element adds to each rerun's payload
+                st.markdown(f"""
+                <a href="{first_url}" {target}>{preview}</a>
+                <div style="opacity: 0.6; font-size: 0.875rem;">{created} · {html.escape(entry.model.split('/')[-1])}</div>
+                <small>{html.escape(entry.prompt[:120])}</small>
+                {f'<br><small>⬇️ {links}</small>' if links else ''}
+                """, unsafe_allow_html=True)
+
+history_section()
 
 # ============================================================================
 # TTM MOTION CONTROL SECTION
@@ -744,11 +1243,9 @@ with st.expander("ℹ️ About TTM (Time-to-Move)"):
     [time-to-move/TTM](https://github.com/time-to-move/TTM)
     """)
 
-ttm_col1, ttm_col2 = st.columns([1, 1])
-
-with ttm_col1:
-    st.subheader("⚙️ TTM Parameters")
-
+@st.fragment
+def ttm_parameters():
+    """TTM sliders; moving one reruns only this block"""
     ttm_tweak = st.slider(
         "Tweak Index",
         min_value=0,
@@ -773,6 +1270,12 @@ with ttm_col1:
     These parameters control the dual-clock denoising process for precise motion control.
     """)
 
+ttm_col1, ttm_col2 = st.columns([1, 1])
+
+with ttm_col1:
+    st.subheader("⚙️ TTM Parameters")
+    ttm_parameters()
+
 with ttm_col2:
     st.subheader("📝 Implementation Notes")
 
@@ -0,0 +1 @@
+"""Offline benchmarks for the CAT REFACER pipeline"""
@@ -0,0 +1,95 @@
+"""Before/after benchmark of the upload pipeline: time and peak memory.
+
+"before" is the original path (full decode, exif_transpose, copy, crop,
+resize); "after" is refacer.imaging.load_9_16 (draft decode, fused crop and
+resize, rotation on the final image). Each run happens in a fresh process
+so peak RSS is not polluted by earlier runs.
+
+    python -m benchmarks.bench_crop_resize [--repeat 3]
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import make_photo
+
+
+def run_before(data):
+    """Original app.py upload path"""
+    from PIL import Image
+    from refacer.imaging import crop_to_9_16, fix_image_orientation, resize_to_final
+
+    image = fix_image_orientation(Image.open(io.BytesIO(data)))
+    cropped = crop_to_9_16(image.copy(), 'center')
+    return resize_to_final(cropped)
+
+
+def run_after(data):
+    """Draft decode with fused crop+resize"""
+    from refacer.imaging import load_9_16
+
+    return load_9_16(data, 'center')
+
+
+VARIANTS = {'before': run_before, 'after': run_after}
+
+
+def _status_mb(field):
+    """Reads a memory field (VmRSS, VmHWM) of this process in MB"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _measure(variant, path, queue):
+    """Child process: runs one variant and reports seconds and peak RSS growth (Linux)"""
+    import PIL.Image  # noqa: F401 - keep import cost out of the measurement
+    import refacer.imaging  # noqa: F401
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    rss_before = _status_mb('VmRSS')
+    start = time.perf_counter()
+    VARIANTS[variant](data)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, _status_mb('VmHWM') - rss_before))
+
+
+def measure(variant, path):
+    """Runs a variant in a fresh process, returns (seconds, peak MB)"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(variant, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--orientation', type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"{'input':>8} {'variant':>8} {'time ms':>10} {'peak MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in (12, 48):
+            path = os.path.join(tmp, f'{megapixels}mp.jpg')
+            with open(path, 'wb') as f:
+                f.write(make_photo(megapixels, args.orientation))
+            for variant in VARIANTS:
+                runs = [measure(variant, path) for _ in range(args.repeat)]
+                elapsed = min(r[0] for r in runs)
+                peak = max(r[1] for r in runs)
+                print(f"{megapixels:>6}MP {variant:>8} {elapsed * 1000:>10.1f} {peak:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
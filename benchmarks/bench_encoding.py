@@ -0,0 +1,31 @@
+"""Encode time and size of each encoding for a 1080x1920 model input.
+
+Replicate receives file inputs as base64 data URIs inside the prediction
+request, so the payload column (bytes * 4/3) is what gets uploaded.
+
+    python -m benchmarks.bench_encoding [--repeat 5]
+"""
+
+import argparse
+
+from benchmarks.corpus import make_photo
+from refacer.encoding import ENCODINGS, encode, format_size
+from refacer.imaging import load_9_16
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    image = load_9_16(make_photo(12), 'center')
+    print(f"{'encoding':>10} {'encode ms':>10} {'size':>10} {'payload':>10}")
+    for name in ENCODINGS:
+        runs = [encode(image, name) for _ in range(args.repeat)]
+        seconds = min(r.seconds for r in runs)
+        size = runs[0].size
+        print(f"{name:>10} {seconds * 1000:>10.1f} {format_size(size):>10} {format_size(size * 4 // 3):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Rate limiter against a provider that answers bursts with 429s.
+
+Concurrent predictions go through refacer.limits and jobs.run_prediction
+to a FakeReplicate that accepts only --provider-rate creates per second,
+while the limiter is configured for more (--limit-rate), as when
+secrets.toml overestimates the account's limit. One bulk session submits
+most of the requests; a few interactive sessions submit one each. Compares
+the limiter with rate adaptation (a 429 halves the bucket rate, accepted
+requests raise it again) against a fixed rate that only backs off.
+
+    python -m benchmarks.bench_limits [--requests 40] [--provider-rate 4] [--limit-rate 10]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from benchmarks.fake_replicate import IMAGE_MODEL, FakeReplicate
+from refacer import jobs, limits
+
+INTERACTIVE_SESSIONS = 4
+
+
+@contextmanager
+def fixed_rate():
+    """Disables rate adaptation: the halved rate is floored at the configured rate"""
+    floor = limits.RATE_FLOOR
+    limits.RATE_FLOOR = 1.0
+    try:
+        yield
+    finally:
+        limits.RATE_FLOOR = floor
+
+
+def run_burst(client, requests, limit_rate, poll_interval=0.05):
+    """Runs requests concurrent predictions, returns a summary dict.
+
+    The first INTERACTIVE_SESSIONS requests come from sessions of their
+    own, submitted after the bulk session's requests are already queued.
+    """
+    limits.configure({IMAGE_MODEL: limits.Limit(per_minute=limit_rate * 60, burst=int(limit_rate),
+                                                 concurrency=requests)})
+    results = {}
+    lock = threading.Lock()
+
+    def predict(idx, session):
+        job = jobs.Job(IMAGE_MODEL, {'prompt': f"request {idx}"}, session=session)
+        try:
+            jobs.run_prediction(client, IMAGE_MODEL, job.input, poll_interval, job)
+            ok = True
+        except jobs.PredictionError:
+            ok = False
+        with lock:
+            results[idx] = (session, ok, job.timings.get('wait', 0.0))
+
+    bulk = [threading.Thread(target=predict, args=(idx, 'bulk'))
+            for idx in range(INTERACTIVE_SESSIONS, requests)]
+    interactive = [threading.Thread(target=predict, args=(idx, f"interactive-{idx}"))
+                   for idx in range(INTERACTIVE_SESSIONS)]
+    start = time.perf_counter()
+    for thread in bulk:
+        thread.start()
+    time.sleep(0.2)
+    for thread in interactive:
+        thread.start()
+    for thread in bulk + interactive:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    waits = {'bulk': [], 'interactive': []}
+    for session, ok, wait in results.values():
+        waits['bulk' if session == 'bulk' else 'interactive'].append(wait)
+    return {
+        'succeeded': sum(1 for _, ok, _ in results.values() if ok),
+        'failed': sum(1 for _, ok, _ in results.values() if not ok),
+        'wall': wall,
+        'bulk_wait': statistics.median(waits['bulk']) if waits['bulk'] else 0.0,
+        'interactive_wait': statistics.median(waits['interactive']),
+    }
+
+
+def run(requests, provider_rate, limit_rate, adaptive=True):
+    """Runs one burst against a fresh rate-limited FakeReplicate, adds its 429 count"""
+    with FakeReplicate(queue_seconds=0.05, inference_seconds=0.1, create_rate=provider_rate) as fake:
+        import replicate
+
+        client = replicate.Client()
+        if adaptive:
+            summary = run_burst(client, requests, limit_rate)
+        else:
+            with fixed_rate():
+                summary = run_burst(client, requests, limit_rate)
+        summary['rate_limited'] = fake.rate_limited
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--provider-rate', type=float, default=4)
+    parser.add_argument('--limit-rate', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, provider {args.provider_rate:g}/s, limiter {args.limit_rate:g}/s")
+    print(f"{'rate':>9} {'ok':>4} {'failed':>6} {'429s':>5} {'wall s':>7} {'bulk wait':>10} {'interactive':>12}")
+    for adaptive in (True, False):
+        summary = run(args.requests, args.provider_rate, args.limit_rate, adaptive)
+        print(f"{'adaptive' if adaptive else 'fixed':>9} {summary['succeeded']:>4} {summary['failed']:>6} "
+              f"{summary['rate_limited']:>5} {summary['wall']:>7.1f} {summary['bulk_wait']:>9.1f}s "
+              f"{summary['interactive_wait']:>11.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Upload preprocessing throughput under concurrent sessions.
+
+Each simulated session is a thread that prepares 12 MP uploads back to
+back, as Streamlit session threads do. Compares running the work inline
+on the session thread with the shared thread and process pools. The
+process pool only pulls ahead on multi-core hosts.
+
+    python -m benchmarks.bench_pool [--sessions 8] [--images 4]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks.corpus import make_photo
+from refacer.pool import BoundedPool, available_cpus, prepare_upload
+
+MODES = ('inline', 'thread', 'process')
+
+
+def run_sessions(mode, data, sessions, images, workers):
+    pool = None if mode == 'inline' else BoundedPool(mode, workers)
+    if pool is not None:
+        pool.run(prepare_upload, data)  # start workers outside the timing
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(images):
+            start = time.perf_counter()
+            if pool is None:
+                prepare_upload(data, 'center', encoding='jpeg')
+            else:
+                pool.run(prepare_upload, data, 'center', (1080, 1920), 'jpeg', timeout=None)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    if pool is not None:
+        pool.shutdown()
+    return wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    data = make_photo(12)
+    print(f"{available_cpus()} CPU(s), {args.sessions} sessions x {args.images} uploads")
+    print(f"{'mode':>8} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in MODES:
+        wall, latencies = run_sessions(mode, data, args.sessions, args.images, args.workers)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f"{mode:>8} {len(latencies) / wall:>8.2f} "
+              f"{statistics.median(latencies) * 1000:>8.0f} {p95 * 1000:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Time per Streamlit rerun with three results on screen.
+
+Runs app.py under streamlit.testing.AppTest with three 1080x1920 results
+in session state and "Use generated image from above" selected in the
+WAN section, then measures plain reruns (what any widget interaction
+costs).
+
+Results are seeded the way the app stores them: put into the app's
+SessionMedia, with their MediaRefs in session state. "before" adds the
+work the old script did on each rerun, when session state held PIL
+images: one PNG encode per download button and one model encode for the
+WAN input. "after" is the app as it is; reruns reuse the stored bytes.
+
+    python -m benchmarks.bench_rerun [--repeat 10]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.corpus import make_photo
+from benchmarks.scratch import use_scratch_data_dir
+from refacer.encoding import DEFAULT_MODEL_ENCODING, encode
+from refacer.pool import prepare_output
+from refacer.session_media import SessionMedia
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+RESULTS = 3
+SESSION_ID = 'benchmark'
+
+
+def make_results():
+    return [prepare_output(make_photo(12, orientation=1, format='JPEG'), 'png') for _ in range(RESULTS)]
+
+
+def capture_session_media():
+    """Returns a list that receives the SessionMedia app.py creates.
+
+    It is a cached resource, so one instance serves every AppTest run of
+    this process.
+    """
+    instances = []
+    init = SessionMedia.__init__
+
+    def record(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        instances.append(self)
+
+    SessionMedia.__init__ = record
+    return instances
+
+
+def legacy_rerun_work(images):
+    """Encodes the old script did on every rerun"""
+    for image in images:
+        encode(image, 'png')
+    encode(images[0], DEFAULT_MODEL_ENCODING)
+
+
+def time_reruns(session_media, results, repeat, legacy_images=None):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.secrets['REPLICATE_API_TOKEN'] = 'benchmark'
+    at.secrets['IMAGE_POOL'] = 'thread'
+    at.session_state['session_id'] = SESSION_ID
+    at.run()
+    assert session_media, "app.py did not create its SessionMedia"
+    at.session_state['generated_images'] = [
+        session_media[0].put(SESSION_ID, f"result_{idx}", result.data, result.encoding.extension,
+                             result.encoding.mime, result.encoding.format)
+        for idx, result in enumerate(results)
+    ]
+    at.session_state['wan_image_source'] = "Use generated image from above"
+    at.run()
+    assert not at.exception, at.exception
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        if legacy_images is not None:
+            legacy_rerun_work(legacy_images)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    use_scratch_data_dir()
+
+    session_media = capture_session_media()
+    results = make_results()
+    legacy_images = [result.image for result in results]
+    variants = {
+        'before': time_reruns(session_media, results, args.repeat, legacy_images),
+        'after': time_reruns(session_media, results, args.repeat),
+    }
+    print(f"{'variant':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, times in variants.items():
+        p95 = statistics.quantiles(times, n=20)[-1]
+        print(f"{name:>8} {statistics.median(times) * 1000:>8.0f} {p95 * 1000:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""Synthetic photo corpus shared by the benchmarks"""
+
+import io
+import math
+
+from PIL import Image
+
+# Typical phone camera sizes (4:3), keyed by megapixels
+PHOTO_SIZES = {
+    12: (4032, 3024),
+    48: (8064, 6048),
+}
+
+
+def make_photo(megapixels=12, orientation=1, format='JPEG'):
+    """Returns encoded bytes of a photo-like image of the given size"""
+    width, height = PHOTO_SIZES.get(megapixels) or (
+        int(math.sqrt(megapixels * 1e6 * 4 / 3)), int(math.sqrt(megapixels * 1e6 * 3 / 4)))
+    gradient = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge('RGB', (gradient, noise, Image.linear_gradient('L').resize((width, height))))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    image.save(buf, format=format, exif=exif.tobytes(), quality=90)
+    return buf.getvalue()
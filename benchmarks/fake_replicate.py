@@ -0,0 +1,193 @@
+"""Local stand-in for Replicate: a fake client plus an HTTP server for outputs.
+
+FakeClient implements the part of replicate.Client the app and the batch
+runner use (models.predictions.create, then reload/cancel on the returned
+prediction). Predictions stay 'starting' for queue_seconds, 'processing'
+for inference_seconds, then succeed with URLs served by a local
+ThreadingHTTPServer, so downloads go through the real requests session.
+With stream_outputs, image URLs appear one by one while processing, like
+models that stream partial outputs. With create_rate, the fake provider
+accepts at most that many creates per second and answers the rest with
+a 429 (RateLimited), like Replicate's per-account limit.
+
+    with FakeReplicate(queue_seconds=0.2, inference_seconds=1.0) as fake:
+        client = replicate.Client()  # patched for the duration
+"""
+
+import functools
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+from PIL import Image
+
+from benchmarks.corpus import make_photo
+
+IMAGE_MODEL = 'google/nano-banana'
+VIDEO_MODEL = 'wan-video/wan-2.2-i2v-fast'
+
+
+class RateLimited(Exception):
+    """429 from the fake provider; status is read like on replicate's ReplicateError"""
+
+    status = 429
+
+
+class FakePrediction:
+    """Prediction whose status follows wall-clock time since creation"""
+
+    def __init__(self, fake, model, input):
+        self.id = uuid.uuid4().hex[:12]
+        self.model = model
+        self.input = input
+        self.status = 'starting'
+        self.logs = ''
+        self.error = None
+        self.output = None
+        self._fake = fake
+        self._created = time.perf_counter()
+        self._canceled = False
+
+    def reload(self):
+        if self.status in ('succeeded', 'failed', 'canceled'):
+            return
+        elapsed = time.perf_counter() - self._created
+        if self._canceled:
+            self.status = 'canceled'
+        elif elapsed < self._fake.queue_seconds:
+            self.status = 'starting'
+        elif elapsed < self._fake.queue_seconds + self._fake.inference_seconds:
+            self.status = 'processing'
+            self.logs = f"step {int(elapsed * 10)}"
+            if self._fake.stream_outputs and self.model != VIDEO_MODEL:
+                outputs = self._fake.output_for(self.model)
+                progress = (elapsed - self._fake.queue_seconds) / self._fake.inference_seconds
+                self.output = outputs[:int(progress * len(outputs))] or None
+        else:
+            self.status = 'succeeded'
+            self.output = self._fake.output_for(self.model)
+
+    def cancel(self):
+        self._canceled = True
+
+
+class _Predictions:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def create(self, model=None, input=None, **kwargs):
+        model = model if isinstance(model, str) else '/'.join(model)
+        # Consume file inputs like the real client, which base64-encodes them
+        for value in (input or {}).values():
+            for item in value if isinstance(value, list) else [value]:
+                if hasattr(item, 'read'):
+                    item.read()
+        with self._fake.lock:
+            if not self._fake.admit():
+                self._fake.rate_limited += 1
+                raise RateLimited("Request was throttled")
+            self._fake.calls.append(model)
+        return FakePrediction(self._fake, model, input)
+
+
+class _Models:
+    def __init__(self, fake):
+        self.predictions = _Predictions(fake)
+
+
+class FakeClient:
+    """Drop-in for replicate.Client bound to a FakeReplicate"""
+
+    fake = None
+
+    def __init__(self, *args, **kwargs):
+        self.models = _Models(self.fake)
+
+
+class FakeReplicate:
+    """Configurable fake Replicate with a local output server.
+
+    image_outputs is a list of (width, height) for the images returned by
+    the image model; video_bytes is the size of the returned video.
+    create_rate caps accepted creates per rolling second (None: no cap);
+    rate_limited counts the creates refused with a 429.
+    """
+
+    def __init__(self, queue_seconds=0.1, inference_seconds=0.5,
+                 image_outputs=((1080, 1920), (1024, 1792)), video_bytes=2 * 1024 * 1024,
+                 stream_outputs=False, create_rate=None):
+        self.queue_seconds = queue_seconds
+        self.inference_seconds = inference_seconds
+        self.stream_outputs = stream_outputs
+        self.create_rate = create_rate
+        self.calls = []
+        self.rate_limited = 0
+        self._accepted = deque()  # times of creates accepted within the last second
+        self.lock = threading.Lock()
+        self.root = tempfile.mkdtemp(prefix='fake-replicate-')
+        self.image_names = []
+        for width, height in image_outputs:
+            name = f"out_{width}x{height}.png"
+            megapixels = width * height / 1e6
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(_make_output(width, height, megapixels))
+            self.image_names.append(name)
+        with open(os.path.join(self.root, 'video.mp4'), 'wb') as f:
+            f.write(os.urandom(video_bytes))
+        handler = functools.partial(_QuietHandler, directory=self.root)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self._original_client = None
+
+    def admit(self):
+        """True if a create fits the provider's rate; called under self.lock"""
+        if self.create_rate is None:
+            return True
+        now = time.monotonic()
+        while self._accepted and now - self._accepted[0] >= 1.0:
+            self._accepted.popleft()
+        if len(self._accepted) >= self.create_rate:
+            return False
+        self._accepted.append(now)
+        return True
+
+    def output_for(self, model):
+        if model == VIDEO_MODEL:
+            return f"{self.base_url}/video.mp4"
+        return [f"{self.base_url}/{name}" for name in self.image_names]
+
+    def __enter__(self):
+        import replicate
+
+        threading.Thread(target=self.server.serve_forever, name='fake-replicate', daemon=True).start()
+        FakeClient.fake = self
+        self._original_client = replicate.Client
+        replicate.Client = FakeClient
+        return self
+
+    def __exit__(self, *exc):
+        import replicate
+
+        replicate.Client = self._original_client
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _make_output(width, height, megapixels):
+    """Model-like PNG output of the given size"""
+    image = Image.open(io.BytesIO(make_photo(megapixels))).convert('RGB').resize((width, height))
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
@@ -0,0 +1,25 @@
+"""Scratch data directory for benchmark runs of app.py.
+
+app.py keeps its result cache, history, media files and metrics under
+REFACER_DATA_DIR (the app directory by default). Benchmarks point it at a
+temporary directory, so their fake generations never reach the
+operator's cache and history.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+DATA_DIR_ENV = 'REFACER_DATA_DIR'
+
+
+def use_scratch_data_dir():
+    """Points app.py's data at a temporary directory for this process and
+    its children, returns its path; the process that created it removes it on exit"""
+    path = os.environ.get(DATA_DIR_ENV)
+    if path is None:
+        path = tempfile.mkdtemp(prefix='refacer-bench-')
+        os.environ[DATA_DIR_ENV] = path
+        atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
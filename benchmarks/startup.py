@@ -0,0 +1,118 @@
+"""Cold-start benchmark: imports pulled in by app.py and time to first paint.
+
+Each run is a fresh interpreter started with ``-X importtime``. It imports
+Streamlit's AppTest harness (the server has those loaded before any
+script runs), then renders app.py once. Reported per run:
+
+    cold_ms         interpreter start to the first complete render
+    first_paint_ms  the first render alone (app imports, process-level setup)
+    imports         modules the first render imported, by cumulative time
+
+startup.first_paint in benchmarks.suite runs the same child, so the
+cold start is part of the baseline gate.
+
+    python -m benchmarks.startup [--repeat 5] [--top 15]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.scratch import use_scratch_data_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = 'startup-benchmark: first render'
+
+
+def _child():
+    """Renders app.py once and prints the first render time as JSON"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+    at.secrets['REPLICATE_API_TOKEN'] = 'benchmark'
+    print(MARKER, file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    at.run()
+    first_paint = time.perf_counter() - start
+    from refacer import pool
+    pool.shutdown()
+    if at.exception:
+        raise SystemExit(f"app.py failed: {at.exception[0].value}")
+    print(json.dumps({'first_paint_ms': round(first_paint * 1000, 1)}))
+
+
+def parse_importtime(stderr):
+    """Returns {top-level module: cumulative ms} for imports after the marker"""
+    imports = {}
+    seen_marker = False
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            seen_marker = True
+            continue
+        if not seen_marker or not line.startswith('import time:'):
+            continue
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        # Nested imports are indented by two spaces per level
+        if name.startswith(' ') and not name.startswith('   '):
+            imports[name.strip()] = int(fields[1]) / 1000
+    return imports
+
+
+def run_once():
+    """Starts a cold interpreter, returns (cold ms, first paint ms, imports)"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'benchmarks.startup', '--child'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    cold = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return cold * 1000, result['first_paint_ms'], parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="number of modules to list")
+    parser.add_argument('--json', help="also write results to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        _child()
+        return 0
+    use_scratch_data_dir()  # inherited by the child interpreters
+
+    colds, paints, imports = [], [], {}
+    for _ in range(args.repeat):
+        cold, paint, run_imports = run_once()
+        colds.append(cold)
+        paints.append(paint)
+        for name, ms in run_imports.items():
+            imports.setdefault(name, []).append(ms)
+    imports = {name: statistics.median(values) for name, values in imports.items()}
+
+    print(f"cold start      p50 {statistics.median(colds):8.1f} ms")
+    print(f"first paint     p50 {statistics.median(paints):8.1f} ms")
+    print(f"\nImported by the first render (cumulative, p50 of {args.repeat} runs):")
+    for name, ms in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<48} {ms:8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cold_ms': round(statistics.median(colds), 1),
+                       'first_paint_ms': round(statistics.median(paints), 1),
+                       'imports_ms': {name: round(ms, 1) for name, ms in imports.items()}}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
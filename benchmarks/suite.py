@@ -0,0 +1,343 @@
+"""Offline benchmark suite with a regression gate against a stored baseline.
+
+Runs without network or a Replicate token: model calls go to
+benchmarks.fake_replicate (configurable latency, outputs served from a
+local HTTP server). Two groups of cases, each run in a fresh process:
+
+    pipeline.*  image pipeline functions over the photo corpus
+    app.*       the real app.py driven headlessly by Streamlit's AppTest
+    startup.*   cold start of a fresh interpreter (benchmarks.startup)
+    limits.*    a request burst against a rate-limited provider (benchmarks.bench_limits)
+
+Each case reports throughput, p50/p95 latency and peak RSS of the
+process during its measured runs (after one warmup run). Results are compared with
+benchmarks/baseline.json; the exit status is 1 if any case's p50 or peak
+memory regresses by more than the tolerance.
+
+    python -m benchmarks.suite [--only app] [--repeat 5] [--tolerance 0.25]
+    python -m benchmarks.suite --update-baseline
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from benchmarks.scratch import use_scratch_data_dir
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+# Differences below these are noise (timer resolution, allocator, import order)
+TIME_SLACK_MS = 5
+MEMORY_SLACK_MB = 10
+# Cheap cases whose single runs vary a lot get more runs than --repeat
+MIN_REPEAT = {'app.rerun': 15}
+
+
+def _status_mb(field):
+    """Reads a memory field (VmRSS, VmHWM) of this process in MB (Linux)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _reset_peak():
+    """Resets VmHWM to the current RSS, so setup does not count (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# Pipeline cases: setup() returns the function to time
+
+def _upload_case(megapixels, orientation):
+    def setup():
+        from benchmarks.corpus import make_photo
+        from refacer.imaging import FINAL_SIZE
+        from refacer.pool import prepare_upload
+
+        data = make_photo(megapixels, orientation)
+        return lambda: prepare_upload(data, 'center', FINAL_SIZE, 'jpeg')
+    return setup
+
+
+def _output_case(width, height):
+    def setup():
+        from benchmarks.fake_replicate import _make_output
+        from refacer.pool import prepare_output
+
+        data = _make_output(width, height, width * height / 1e6)
+        return lambda: prepare_output(data, 'png')
+    return setup
+
+
+# App cases: drive app.py through AppTest with the fake Replicate
+
+def _patch_uploads(files):
+    """Makes st.file_uploader return the given bytes per widget key"""
+    import io
+
+    import streamlit
+
+    class Upload(io.BytesIO):
+        def __init__(self, key, data):
+            super().__init__(data)
+            self.name = f"{key}.jpg"
+            self.file_id = key
+            self.type = 'image/jpeg'
+            self.size = len(data)
+
+    original = streamlit.file_uploader
+
+    def file_uploader(label, *args, key=None, **kwargs):
+        original(label, *args, key=key, **kwargs)
+        return Upload(key, files[key]) if key in files else None
+
+    streamlit.file_uploader = file_uploader
+
+
+def _new_app():
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.secrets['REPLICATE_API_TOKEN'] = 'benchmark'
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at
+
+
+def _wait_for(at, job_key, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while job_key in at.session_state:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"{job_key} did not finish")
+        time.sleep(0.05)
+        at.run()
+    if at.exception or at.error:
+        raise RuntimeError((at.exception or at.error)[0].value)
+
+
+def _history_count():
+    """Generations recorded in the app's history database (in the scratch data directory)"""
+    import sqlite3
+
+    from benchmarks.scratch import DATA_DIR_ENV
+
+    path = os.path.join(os.environ[DATA_DIR_ENV], '.cache', 'history.sqlite3')
+    if not os.path.exists(path):
+        return 0
+    db = sqlite3.connect(path)
+    try:
+        return db.execute('SELECT COUNT(*) FROM generations').fetchone()[0]
+    finally:
+        db.close()
+
+
+def _wait_for_history(count, timeout=60):
+    """Waits until the app's background history recording has stored count generations"""
+    deadline = time.perf_counter() + timeout
+    while _history_count() < count:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("history recording did not finish")
+        time.sleep(0.05)
+
+
+def _app_setup(flow):
+    def setup():
+        from benchmarks.corpus import make_photo
+        from benchmarks.fake_replicate import FakeReplicate
+
+        fake = FakeReplicate().__enter__()  # process exits after the case
+        _patch_uploads({'uploader_1': make_photo(12), 'uploader_2': make_photo(12, orientation=6),
+                        'wan_uploader': make_photo(12)})
+        at = _new_app()
+        # A new prompt per run, so the persistent result cache never answers
+        prompts = (f"benchmark {uuid.uuid4().hex} {n}" for n in itertools.count())
+
+        def generate():
+            at.text_area[0].set_value(next(prompts))
+            next(b for b in at.button if 'Generate Image' in b.label).click()
+            at.run()
+            _wait_for(at, 'image_job')
+
+        def rerun():
+            at.run()
+
+        def video():
+            at.text_area(key='wan_prompt').set_value(f"the camera slowly zooms in, {next(prompts)}")
+            next(b for b in at.button if 'Generate Video' in b.label).click()
+            at.run()
+            _wait_for(at, 'wan_job')
+
+        if flow == 'rerun':
+            recorded = _history_count()
+            generate()
+            # Thumbnails are rendered in the background after a generation;
+            # reruns are timed once that has settled
+            _wait_for_history(recorded + 1)
+        return {'generate': generate, 'rerun': rerun, 'video': video}[flow]
+    return setup
+
+
+def _startup_setup():
+    from benchmarks.startup import run_once
+
+    return run_once
+
+
+def _limits_setup():
+    from benchmarks.bench_limits import run
+
+    def burst():
+        random.seed(0)  # same backoff jitter every run
+        # The limiter allows more than the fake provider; its 429s are absorbed
+        summary = run(requests=20, provider_rate=4, limit_rate=10)
+        if summary['failed']:
+            raise RuntimeError(f"{summary['failed']} of 20 requests failed after "
+                               f"{summary['rate_limited']} 429s")
+    return burst
+
+
+CASES = {
+    'pipeline.upload_12mp': _upload_case(12, 1),
+    'pipeline.upload_48mp_rotated': _upload_case(48, 6),
+    'pipeline.output_passthrough': _output_case(1080, 1920),
+    'pipeline.output_resize': _output_case(1024, 1792),
+    'app.generate': _app_setup('generate'),
+    'app.rerun': _app_setup('rerun'),
+    'app.video': _app_setup('video'),
+    'startup.first_paint': _startup_setup,
+    'limits.burst': _limits_setup,
+}
+
+
+def _run_case(name, repeat, queue, verbose):
+    """Child process: warms up, then times repeat runs of one case"""
+    if not verbose:
+        # Streamlit logs config and bare-mode warnings; errors come back via queue
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 2)
+    try:
+        fn = CASES[name]()
+        fn()
+        _reset_peak()
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+        queue.put((latencies, _status_mb('VmHWM'), None))
+    except Exception as e:
+        queue.put((None, None, f"{type(e).__name__}: {e}"))
+    finally:
+        # Pool workers are not daemonic; the process would wait for them on exit
+        from refacer import pool
+        pool.shutdown()
+
+
+def run_case(name, repeat, verbose=False):
+    """Runs a case in a fresh process, returns its summary dict"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(name, repeat, queue, verbose))
+    proc.start()
+    latencies, peak_mb, error = queue.get()
+    proc.join()
+    if error is not None:
+        raise RuntimeError(f"{name}: {error}")
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    return {
+        'runs': len(latencies),
+        'throughput': round(len(latencies) / sum(latencies), 3),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(p95 * 1000, 1),
+        'peak_mb': round(peak_mb, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression messages"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            continue
+        if result['p50_ms'] > base['p50_ms'] * (1 + tolerance) + TIME_SLACK_MS:
+            regressions.append(f"{name}: p50 {result['p50_ms']} ms vs baseline {base['p50_ms']} ms")
+        if result['peak_mb'] > base['peak_mb'] * (1 + tolerance) + MEMORY_SLACK_MB:
+            regressions.append(f"{name}: peak {result['peak_mb']} MB vs baseline {base['peak_mb']} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', default='', help="run cases whose name starts with this")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed relative regression of p50 and peak memory")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', help="also write results to this file")
+    parser.add_argument('--verbose', action='store_true', help="show log output of the cases")
+    args = parser.parse_args(argv)
+    use_scratch_data_dir()  # inherited by the case processes
+
+    results = {}
+    print(f"{'case':<32} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>9}")
+    for name in CASES:
+        if not name.startswith(args.only):
+            continue
+        result = results[name] = run_case(name, max(args.repeat, MIN_REPEAT.get(name, 0)), args.verbose)
+        print(f"{name:<32} {result['throughput']:>8.2f} {result['p50_ms']:>9.1f} "
+              f"{result['p95_ms']:>9.1f} {result['peak_mb']:>9.1f}", flush=True)
+
+    report = {'cpu_count': os.cpu_count(), 'python': sys.version.split()[0], 'cases': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {'cases': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({key: value for key, value in report.items() if key != 'cases'})
+        baseline['cases'].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet; run with --update-baseline to store one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('cpu_count') != os.cpu_count():
+        print(f"Note: baseline was recorded on {baseline.get('cpu_count')} CPU(s), "
+              f"this host has {os.cpu_count()}")
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""CAT REFACER processing package - UI-free, cheap to import"""
+
+from refacer.imaging import (
+    DEFAULT_MAX_MEGAPIXELS,
+    FINAL_SIZE,
+    PREVIEW_SIZE,
+    ImageInfo,
+    ImageTooLarge,
+    check_pixel_budget,
+    crop_and_resize,
+    crop_box_9_16,
+    crop_to_9_16,
+    crop_to_9_16_batch,
+    encode_image,
+    fix_image_orientation,
+    fix_image_orientation_and_resize,
+    fix_image_orientation_and_resize_batch,
+    get_exif_orientation,
+    get_oriented_size,
+    is_final_image,
+    load_9_16,
+    load_preview_base,
+    open_bounded,
+    probe,
+    process_upload,
+    process_upload_batch,
+    render_preview,
+    render_thumbnail,
+    resize_to_final,
+    resize_to_final_batch,
+    set_pixel_budget,
+)
@@ -0,0 +1,283 @@
+"""Batch generation: many prompts x many reference images in one run.
+
+A manifest is a CSV file (or a ZIP holding manifest.csv and the images)
+with one generation per row:
+
+    id,prompt,image_1,crop_1,image_2,crop_2
+    cat-01,Make it cyberpunk,photos/cat1.jpg,top,,
+    cat-02,Vintage 1970s style,https://example.com/cat2.png,center,logo.png,
+
+Only ``prompt`` and ``image_1`` are required. Image values are paths
+relative to the manifest (or inside the ZIP) or http(s) URLs; manifests
+from untrusted users are run with public_urls_only, so their URLs cannot
+reach loopback, private or metadata addresses. Each row goes
+through the same pipeline as the app: 9:16 crop and resize, nano-banana,
+then 9:16 resize of every output. Rows run with a concurrency limit;
+finished rows are appended to results.jsonl, so an interrupted batch
+resumes where it stopped. outputs.csv lists the produced files per row.
+
+    python -m refacer.batch manifest.csv --out batch_out --concurrency 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from refacer.downloads import DownloadRefused, fetch_all, fetch_bytes
+from refacer.encoding import DEFAULT_MODEL_ENCODING
+from refacer.imaging import FINAL_SIZE
+from refacer.jobs import DEFAULT_POLL_INTERVAL, run_prediction
+from refacer.pool import prepare_output, prepare_upload, run_in_pool
+
+MODEL = 'google/nano-banana'
+DEFAULT_CONCURRENCY = 4
+MANIFEST_NAME = 'manifest.csv'
+RESULTS_NAME = 'results.jsonl'
+OUTPUTS_NAME = 'outputs.csv'
+IMAGE_COLUMNS = ('image_1', 'image_2')
+
+
+class ManifestError(ValueError):
+    """Manifest is missing, malformed or references missing images"""
+
+
+def read_manifest(path, work_dir=None):
+    """Returns (rows, base_dir) for a CSV manifest or a ZIP containing one.
+
+    ZIP archives are extracted into work_dir (default: next to the archive).
+    Every row gets an ``id`` (its own, or its 1-based line number).
+    """
+    if zipfile.is_zipfile(path):
+        base_dir = os.path.join(work_dir or os.path.dirname(os.path.abspath(path)), 'inputs')
+        with zipfile.ZipFile(path) as archive:
+            archive.extractall(base_dir)
+        candidates = [os.path.join(root, name)
+                      for root, _, names in os.walk(base_dir) for name in names
+                      if name.lower().endswith('.csv') and not name.startswith('.')]
+        preferred = [c for c in candidates if os.path.basename(c) == MANIFEST_NAME]
+        if not (preferred or candidates):
+            raise ManifestError("ZIP archive does not contain a CSV manifest")
+        csv_path = sorted(preferred or candidates, key=len)[0]
+    else:
+        csv_path = path
+    base_dir = os.path.dirname(os.path.abspath(csv_path))
+
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'prompt', 'image_1'} - set(reader.fieldnames or [])
+        if missing:
+            raise ManifestError(f"Manifest is missing column(s): {', '.join(sorted(missing))}")
+        rows = []
+        for line, row in enumerate(reader, start=1):
+            row = {key: (value or '').strip() for key, value in row.items() if key}
+            if not row.get('prompt') or not row.get('image_1'):
+                continue
+            row['id'] = row.get('id') or f"{line:05d}"
+            rows.append(row)
+    ids = [row['id'] for row in rows]
+    if len(ids) != len(set(ids)):
+        raise ManifestError("Manifest row ids must be unique")
+    return rows, base_dir
+
+
+def read_image_source(value, base_dir, public_only=False):
+    """Returns bytes of an image given as URL or path relative to base_dir.
+
+    With public_only, URLs must point to public hosts.
+    """
+    if value.startswith(('http://', 'https://')):
+        try:
+            return fetch_bytes(value, public_only=public_only)
+        except DownloadRefused as e:
+            raise ManifestError(f"Image URL refused: {value}: {e}")
+    path = os.path.realpath(os.path.join(base_dir, value))
+    if os.path.commonpath([path, os.path.realpath(base_dir)]) != os.path.realpath(base_dir):
+        raise ManifestError(f"Image path outside the manifest directory: {value}")
+    if not os.path.isfile(path):
+        raise ManifestError(f"Image not found: {value}")
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class BatchRunner:
+    """Runs manifest rows through the 9:16 pipeline with bounded concurrency"""
+
+    def __init__(self, client, out_dir, concurrency=DEFAULT_CONCURRENCY,
+                 model_encoding=DEFAULT_MODEL_ENCODING, output_encoding='png',
+                 poll_interval=DEFAULT_POLL_INTERVAL, public_urls_only=False):
+        self.client = client
+        self.out_dir = out_dir
+        self.concurrency = concurrency
+        self.model_encoding = model_encoding
+        self.output_encoding = output_encoding
+        self.poll_interval = poll_interval
+        self.public_urls_only = public_urls_only
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.finished = False
+        self.error = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(out_dir, 'outputs'), exist_ok=True)
+
+    @property
+    def results_path(self):
+        return os.path.join(self.out_dir, RESULTS_NAME)
+
+    def load_results(self):
+        """Returns the latest recorded result per row id"""
+        results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from an interrupted run
+                    results[record['id']] = record
+        return results
+
+    def _record(self, record):
+        with self._lock:
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+            if record['status'] == 'succeeded':
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def run_row(self, row, base_dir):
+        """Generates one row, saves its outputs, returns the result record"""
+        start = time.perf_counter()
+        input_data = {"prompt": row['prompt'], "image_input": []}
+        for n, column in enumerate(IMAGE_COLUMNS, start=1):
+            if row.get(column):
+                data = read_image_source(row[column], base_dir, self.public_urls_only)
+                encoded = run_in_pool(prepare_upload, data, row.get(f'crop_{n}') or 'center',
+                                      FINAL_SIZE, self.model_encoding)
+                input_data["image_input"].append(encoded.to_buffer(f"image_{n}"))
+
+        # All rows share one fair-queue session, so a batch cannot starve app users
+        output = run_prediction(self.client, MODEL, input_data, self.poll_interval, session='batch')
+        urls = [output] if isinstance(output, str) else list(output or [])
+        if not urls:
+            raise RuntimeError("Model returned no result")
+
+        def process(data):
+            return run_in_pool(prepare_output, data, self.output_encoding)
+
+        outputs = [None] * len(urls)
+        for idx, encoded, error in fetch_all(urls, process=process, model=MODEL):
+            if error is not None:
+                raise error
+            name = f"{re.sub(r'[^A-Za-z0-9._-]', '_', row['id'])}_{idx + 1}.{encoded.encoding.extension}"
+            with open(os.path.join(self.out_dir, 'outputs', name), 'wb') as f:
+                f.write(encoded.data)
+            outputs[idx] = f"outputs/{name}"
+        return {'id': row['id'], 'status': 'succeeded', 'outputs': outputs,
+                'seconds': round(time.perf_counter() - start, 3)}
+
+    def _run_row_safe(self, row, base_dir):
+        try:
+            record = self.run_row(row, base_dir)
+        except Exception as e:
+            record = {'id': row['id'], 'status': 'failed', 'error': str(e)}
+        self._record(record)
+        return record
+
+    def run(self, rows, base_dir, on_progress=None):
+        """Runs every row not yet succeeded; returns results per row id"""
+        done = {key for key, record in self.load_results().items() if record['status'] == 'succeeded'}
+        pending = [row for row in rows if row['id'] not in done]
+        self.total = len(rows)
+        self.succeeded = len(rows) - len(pending)
+        self.failed = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch') as executor:
+            futures = [executor.submit(self._run_row_safe, row, base_dir) for row in pending]
+            for future in as_completed(futures):
+                future.result()
+                if on_progress is not None:
+                    on_progress(self)
+
+        results = self.load_results()
+        self.write_outputs_manifest(rows, results)
+        return results
+
+    def run_in_background(self, rows, base_dir, on_finished=None):
+        """Starts run() on a daemon thread; errors end up in self.error"""
+        def target():
+            try:
+                self.run(rows, base_dir)
+                if on_finished is not None:
+                    on_finished(self)
+            except Exception as e:
+                self.error = str(e)
+            finally:
+                self.finished = True
+
+        self.total = len(rows)
+        thread = threading.Thread(target=target, name='batch-runner', daemon=True)
+        thread.start()
+        return thread
+
+    def write_outputs_manifest(self, rows, results):
+        """Writes outputs.csv: one line per manifest row with status and files"""
+        path = os.path.join(self.out_dir, OUTPUTS_NAME)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'prompt', 'status', 'outputs', 'error', 'seconds'])
+            for row in rows:
+                record = results.get(row['id'], {'status': 'pending'})
+                writer.writerow([row['id'], row['prompt'], record['status'],
+                                 ';'.join(record.get('outputs') or []),
+                                 record.get('error', ''), record.get('seconds', '')])
+        return path
+
+    def archive(self, path):
+        """Writes a ZIP with outputs.csv and all output images"""
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            archive.write(os.path.join(self.out_dir, OUTPUTS_NAME), OUTPUTS_NAME)
+            outputs_dir = os.path.join(self.out_dir, 'outputs')
+            for name in sorted(os.listdir(outputs_dir)):
+                archive.write(os.path.join(outputs_dir, name), f"outputs/{name}")
+        return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch 9:16 generation with google/nano-banana")
+    parser.add_argument('manifest', help="CSV manifest or ZIP with manifest.csv and images")
+    parser.add_argument('--out', required=True, help="output directory (reuse it to resume)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--model-encoding', default=DEFAULT_MODEL_ENCODING)
+    parser.add_argument('--output-encoding', default='png')
+    args = parser.parse_args(argv)
+
+    import replicate
+
+    # Token is read from REPLICATE_API_TOKEN
+    client = replicate.Client()
+    rows, base_dir = read_manifest(args.manifest, work_dir=args.out)
+    runner = BatchRunner(client, args.out, args.concurrency,
+                         args.model_encoding, args.output_encoding)
+
+    def report(runner):
+        print(f"\r{runner.succeeded + runner.failed}/{runner.total} done, "
+              f"{runner.failed} failed", end='', file=sys.stderr, flush=True)
+
+    results = runner.run(rows, base_dir, on_progress=report)
+    print(file=sys.stderr)
+    failed = [key for key, record in results.items() if record['status'] != 'succeeded']
+    print(f"{len(rows) - len(failed)}/{len(rows)} rows succeeded; see {os.path.join(args.out, OUTPUTS_NAME)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Concurrent result downloads over a shared keep-alive HTTP session.
+
+requests is imported with the first session, so importing this module
+stays cheap for processes that never download anything.
+
+fetch_bytes() holds at most max_bytes in memory. URLs that come from
+users (e.g. batch manifests uploaded in the app) are fetched with
+public_only=True: every connection, including each redirect hop, is
+refused unless the addresses its host resolves to, and then the address
+it actually connected to, are globally routable. Both checks run before
+the request is sent.
+"""
+
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from refacer import metrics
+
+# (connect, read) timeouts in seconds
+DOWNLOAD_TIMEOUT = (5, 60)
+DOWNLOAD_WORKERS = 8
+# urllib3 Retry options
+DOWNLOAD_RETRIES = dict(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(['GET']),
+)
+CHUNK_SIZE = 256 * 1024
+# Largest download fetch_bytes() holds in memory
+MAX_DOWNLOAD_BYTES = 100 * 1024 * 1024
+
+_lock = threading.Lock()
+_sessions = {}
+_executor = None
+
+
+class DownloadRefused(ValueError):
+    """Download larger than allowed, or from a host that is not public"""
+
+
+def _public_address(address):
+    address = ipaddress.ip_address(address.split('%')[0])  # drop an IPv6 scope id
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_global
+
+
+def _public_adapter(**kwargs):
+    """HTTPAdapter whose connections refuse peers that are not globally routable"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def public_only(connection_cls):
+        class PublicConnection(connection_cls):
+            def _new_conn(self):
+                try:
+                    resolved = socket.getaddrinfo(self._dns_host, self.port, type=socket.SOCK_STREAM)
+                except OSError:
+                    resolved = []  # super() reports the resolution error
+                if not all(_public_address(sockaddr[0]) for *_, sockaddr in resolved):
+                    raise DownloadRefused(f"{self.host} is not a public host")
+                sock = super()._new_conn()
+                if not _public_address(sock.getpeername()[0]):
+                    sock.close()
+                    raise DownloadRefused(f"{self.host} is not a public host")
+                return sock
+        return PublicConnection
+
+    class PublicHTTPPool(HTTPConnectionPool):
+        ConnectionCls = public_only(HTTPConnectionPool.ConnectionCls)
+
+    class PublicHTTPSPool(HTTPSConnectionPool):
+        ConnectionCls = public_only(HTTPSConnectionPool.ConnectionCls)
+
+    class PublicAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kw):
+            super().init_poolmanager(*args, **kw)
+            self.poolmanager.pool_classes_by_scheme = {'http': PublicHTTPPool, 'https': PublicHTTPSPool}
+
+    return PublicAdapter(**kwargs)
+
+
+def get_session(public_only=False):
+    """Returns the process-wide requests.Session with pooling and retries.
+
+    The public_only session connects to globally routable addresses only
+    and ignores proxy settings from the environment.
+    """
+    with _lock:
+        if public_only not in _sessions:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            options = dict(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS,
+                           max_retries=Retry(**DOWNLOAD_RETRIES))
+            adapter = _public_adapter(**options) if public_only else HTTPAdapter(**options)
+            if public_only:
+                session.trust_env = False  # a proxy would hide the real peer
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[public_only] = session
+        return _sessions[public_only]
+
+
+def get_executor():
+    """Returns the process-wide bounded download thread pool"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS,
+                                           thread_name_prefix='download')
+        return _executor
+
+
+def _counted(chunks, model):
+    for chunk in chunks:
+        metrics.BYTES.inc(len(chunk), direction='download', model=model)
+        yield chunk
+
+
+def fetch_bytes(url, timeout=DOWNLOAD_TIMEOUT, model='', max_bytes=MAX_DOWNLOAD_BYTES, public_only=False):
+    """Downloads URL content, streaming it in chunks.
+
+    Raises DownloadRefused once the content exceeds max_bytes (None: no
+    limit), or with public_only if the host is not public.
+    """
+    with metrics.span('download', model):
+        with get_session(public_only).get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get('Content-Length', '')
+            if max_bytes is not None and length.isdigit() and int(length) > max_bytes:
+                raise DownloadRefused(f"Download of {int(length)} bytes exceeds the {max_bytes} byte limit")
+            chunks = []
+            size = 0
+            for chunk in _counted(response.iter_content(CHUNK_SIZE), model):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise DownloadRefused(f"Download exceeds the {max_bytes} byte limit")
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+
+def fetch_to_store(url, store, extension, mime, timeout=DOWNLOAD_TIMEOUT, model=''):
+    """Streams URL content into a MediaStore in chunks, returns MediaHandle"""
+    with metrics.span('download', model):
+        with get_session().get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            return store.save_stream(_counted(response.iter_content(CHUNK_SIZE), model), extension, mime)
+
+
+def fetch_and_process(url, process=None, model=''):
+    """Downloads URL content and runs process(data) on it, returns the result"""
+    data = fetch_bytes(url, model=model)
+    if process is None:
+        return data
+    start = time.perf_counter()
+    result = process(data)
+    metrics.observe('process_result', time.perf_counter() - start, model)
+    return result
+
+
+def fetch_all(urls, process=None, model=''):
+    """Downloads URLs in parallel, yielding (index, result, error) as each completes.
+
+    process(data) runs on the download thread as soon as that URL's bytes
+    arrive, so decoding overlaps with the remaining downloads.
+    """
+    executor = get_executor()
+    futures = {executor.submit(fetch_and_process, url, process, model): idx
+               for idx, url in enumerate(urls)}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, e
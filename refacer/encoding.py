@@ -0,0 +1,101 @@
+"""Image encodings for the upload-to-model path and the user-download path"""
+
+import io
+import time
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class Encoding:
+    """Pillow save format plus options, with the MIME type and extension it produces"""
+    label: str
+    format: str
+    mime: str
+    extension: str
+    options: dict = field(default_factory=dict)
+
+
+ENCODINGS = {
+    'png': Encoding('PNG (lossless)', 'PNG', 'image/png', 'png', {'compress_level': 6}),
+    'png-fast': Encoding('PNG (fast, larger)', 'PNG', 'image/png', 'png', {'compress_level': 1}),
+    'jpeg': Encoding('JPEG (quality 92)', 'JPEG', 'image/jpeg', 'jpg', {'quality': 92, 'subsampling': 0}),
+    'webp': Encoding('WebP (quality 90)', 'WEBP', 'image/webp', 'webp', {'quality': 90, 'method': 4}),
+}
+
+# Model inputs only need to look right to the model: small and fast to encode.
+# Downloads stay lossless by default.
+DEFAULT_MODEL_ENCODING = 'jpeg'
+DEFAULT_DOWNLOAD_ENCODING = 'png'
+
+
+@dataclass
+class EncodedImage:
+    """Encoded image bytes with the encoding used and time spent encoding.
+
+    The decoded image and re-encodings are computed on first use and kept,
+    so code that runs on every Streamlit rerun can ask for them freely.
+    """
+    data: bytes
+    encoding: Encoding
+    seconds: float = 0.0
+    _reencoded: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @cached_property
+    def image(self):
+        """Decoded PIL image"""
+        image = Image.open(io.BytesIO(self.data))
+        image.load()
+        return image
+
+    def reencode(self, name):
+        """Returns the image in the named encoding, encoding at most once per name"""
+        if self.encoding == get_encoding(name):
+            return self
+        if name not in self._reencoded:
+            self._reencoded[name] = encode(self.image, name)
+        return self._reencoded[name]
+
+    def to_buffer(self, name='image'):
+        """Returns a named buffer so uploaders can infer the MIME type"""
+        buf = io.BytesIO(self.data)
+        buf.name = f"{name}.{self.encoding.extension}"
+        return buf
+
+
+def get_encoding(name):
+    """Returns Encoding by name, falling back to lossless PNG"""
+    return ENCODINGS.get(name, ENCODINGS['png'])
+
+
+def encode(image, name=DEFAULT_DOWNLOAD_ENCODING):
+    """Encodes a PIL image with the named encoding and times it"""
+    encoding = get_encoding(name)
+    if encoding.format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    start = time.perf_counter()
+    buf = io.BytesIO()
+    image.save(buf, format=encoding.format, **encoding.options)
+    return EncodedImage(buf.getvalue(), encoding, time.perf_counter() - start)
+
+
+def from_bytes(data):
+    """Wraps already encoded bytes as EncodedImage, or returns None for other formats"""
+    image_format = Image.open(io.BytesIO(data)).format
+    for encoding in ENCODINGS.values():
+        if encoding.format == image_format:
+            return EncodedImage(data, replace(encoding, label=f"{image_format} (original)", options={}))
+    return None
+
+
+def format_size(num_bytes):
+    """Human readable byte count"""
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.1f} MB"
+    return f"{num_bytes / 1024:.0f} KB"
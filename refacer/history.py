@@ -0,0 +1,187 @@
+"""Persistent generation history: SQLite metadata plus content-addressed blobs.
+
+Every finished generation is recorded with its model, prompt, inputs
+digest (the result cache key), timings and outputs. Output files and
+small JPEG thumbnails rendered at record time go to a MediaStore, whose
+content-hashed names the rows reference; identical outputs are stored
+once. The gallery pages through rows by the created_at index and only
+ever serves thumbnails, so browsing thousands of results never decodes a
+full-size image. Pages and the model list are memoized until the next
+record(), so the gallery costs no queries on reruns that change nothing.
+
+    history = History('.cache/history.sqlite3', MediaStore('static/history'))
+    history.record(model, prompt, key, [HistoryOutput('png', 'image/png', data, thumbnail)])
+    entries, total = history.page(query='sailor', page=0)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+from refacer.media_store import MediaHandle
+
+DEFAULT_HISTORY_BYTES = 5 * 1024 * 1024 * 1024
+DEFAULT_PAGE_SIZE = 24
+THUMBNAIL_SIZE = 320
+THUMBNAIL_MIME = 'image/jpeg'
+# Memoized page and model list results, cleared by record()
+MEMO_ENTRIES = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    inputs_digest TEXT NOT NULL,
+    timings TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_created_at ON generations (created_at);
+CREATE INDEX IF NOT EXISTS generations_model ON generations (model, created_at);
+CREATE TABLE IF NOT EXISTS outputs (
+    generation_id INTEGER NOT NULL REFERENCES generations (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mime TEXT NOT NULL,
+    thumbnail TEXT,
+    thumbnail_size INTEGER,
+    PRIMARY KEY (generation_id, position)
+);
+"""
+
+
+@dataclass
+class HistoryOutput:
+    """Output to record: extension, MIME type, bytes or file path, and thumbnail bytes (or None)"""
+    extension: str
+    mime: str
+    blob: object
+    thumbnail: bytes = None
+
+
+@dataclass
+class HistoryEntry:
+    """Recorded generation with MediaHandles of its outputs and thumbnails (None if missing)"""
+    id: int
+    created_at: float
+    model: str
+    prompt: str
+    inputs_digest: str
+    timings: dict
+    outputs: list = field(default_factory=list)
+    thumbnails: list = field(default_factory=list)
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+class History:
+    """Generation history in a SQLite database, files in a MediaStore"""
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self._lock = threading.Lock()
+        self._memo = {}
+        # One connection shared by the worker threads that record and the
+        # script threads that browse, serialized by the lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        self._db.executescript(SCHEMA)
+
+    def record(self, model, prompt, inputs_digest, outputs, timings=None):
+        """Stores outputs and their thumbnails, adds a history row, returns its id"""
+        rows = []
+        for output in outputs:
+            if isinstance(output.blob, (bytes, bytearray)):
+                handle = self.store.save_bytes(output.blob, output.extension, output.mime)
+            else:
+                handle = self.store.save_file(output.blob, output.extension, output.mime)
+            thumbnail = None
+            if output.thumbnail is not None:
+                thumbnail = self.store.save_bytes(output.thumbnail, 'jpg', THUMBNAIL_MIME)
+            rows.append((handle, thumbnail))
+
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT INTO generations (created_at, model, prompt, inputs_digest, timings) VALUES (?, ?, ?, ?, ?)',
+                (time.time(), model, prompt, inputs_digest, json.dumps(timings or {})),
+            )
+            generation_id = cursor.lastrowid
+            self._db.executemany(
+                'INSERT INTO outputs (generation_id, position, name, size, mime, thumbnail, thumbnail_size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(generation_id, position, handle.name, handle.size, handle.mime,
+                  thumbnail.name if thumbnail else None, thumbnail.size if thumbnail else None)
+                 for position, (handle, thumbnail) in enumerate(rows)],
+            )
+            self._memo.clear()
+        return generation_id
+
+    def page(self, query='', model=None, page=0, page_size=DEFAULT_PAGE_SIZE):
+        """Returns (entries of one page, newest first, total matching entries).
+
+        query matches a substring of the prompt, case-insensitively.
+        """
+        where, params = [], []
+        if query:
+            where.append("prompt LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(query))
+        if model:
+            where.append('model = ?')
+            params.append(model)
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        memo_key = ('page', query, model, page, page_size)
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+            total = self._db.execute(f'SELECT COUNT(*) FROM generations {clause}', params).fetchone()[0]
+            rows = self._db.execute(
+                f'SELECT id, created_at, model, prompt, inputs_digest, timings FROM generations {clause} '
+                'ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?',
+                params + [page_size, page * page_size],
+            ).fetchall()
+            entries = {row[0]: HistoryEntry(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]))
+                       for row in rows}
+            if entries:
+                outputs = self._db.execute(
+                    f'SELECT generation_id, name, size, mime, thumbnail, thumbnail_size FROM outputs '
+                    f'WHERE generation_id IN ({",".join("?" * len(entries))}) ORDER BY generation_id, position',
+                    list(entries),
+                ).fetchall()
+            else:
+                outputs = []
+            for generation_id, name, size, mime, thumbnail, thumbnail_size in outputs:
+                entry = entries[generation_id]
+                entry.outputs.append(MediaHandle(name, size, mime))
+                entry.thumbnails.append(
+                    MediaHandle(thumbnail, thumbnail_size, THUMBNAIL_MIME) if thumbnail else None)
+            return self._remember(memo_key, (list(entries.values()), total))
+
+    def models(self):
+        """Returns the models that appear in the history"""
+        with self._lock:
+            if ('models',) in self._memo:
+                return self._memo[('models',)]
+            return self._remember(('models',), [
+                row[0] for row in self._db.execute('SELECT DISTINCT model FROM generations ORDER BY model')])
+
+    def _remember(self, key, result):
+        """Memoizes a query result until the next record(), under the lock"""
+        if len(self._memo) >= MEMO_ENTRIES:
+            self._memo.clear()
+        self._memo[key] = result
+        return result
+
+    def stats(self):
+        """Returns (generations, output files)"""
+        with self._lock:
+            generations = self._db.execute('SELECT COUNT(*) FROM generations').fetchone()[0]
+            outputs = self._db.execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+        return generations, outputs
@@ -0,0 +1,370 @@
+"""9:16 image pipeline: EXIF orientation fix, crop, resize and encode.
+
+Only depends on Pillow, so it can be imported from batch workers and
+benchmarks without starting Streamlit or the Replicate client.
+"""
+
+import io
+import math
+from dataclasses import dataclass
+
+from PIL import Image
+
+# Final output dimensions (9:16)
+FINAL_SIZE = (1080, 1920)
+
+# Crop preview dimensions (9:16) and encoding
+PREVIEW_SIZE = (360, 640)
+PREVIEW_FORMAT = 'JPEG'
+PREVIEW_QUALITY = 80
+
+# EXIF orientation tag and the transpose that undoes each orientation value
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Transposes that are their own inverse; ROTATE_90/ROTATE_270 undo each other
+TRANSPOSE_INVERSE = {
+    Image.Transpose.ROTATE_90: Image.Transpose.ROTATE_270,
+    Image.Transpose.ROTATE_270: Image.Transpose.ROTATE_90,
+}
+
+# Pixel budget of a single decode. JPEGs above it are decoded at reduced
+# resolution (DCT scaling by up to MAX_REDUCTION per side), other formats
+# above it are refused. A small, highly compressed file can otherwise
+# decode into hundreds of megapixels. Pillow's own decompression bomb
+# guard (Image.MAX_IMAGE_PIXELS) is left as is and still applies first.
+DEFAULT_MAX_MEGAPIXELS = 50
+MAX_REDUCTION = 4
+
+_max_megapixels = DEFAULT_MAX_MEGAPIXELS
+
+
+class ImageTooLarge(ValueError):
+    """Image has more pixels than the decode budget allows"""
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """Image properties read from the file headers"""
+    width: int
+    height: int
+    format: str
+    orientation: int = 1
+
+    @property
+    def megapixels(self):
+        return self.width * self.height / 1e6
+
+    @property
+    def oriented_size(self):
+        """Size after EXIF orientation fix"""
+        if self.orientation in (5, 6, 7, 8):
+            return (self.height, self.width)
+        return (self.width, self.height)
+
+
+def set_pixel_budget(max_megapixels=DEFAULT_MAX_MEGAPIXELS):
+    """Sets the decode budget of this process"""
+    global _max_megapixels
+    _max_megapixels = max_megapixels
+
+
+def _open(data):
+    try:
+        return Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+
+
+def check_pixel_budget(info):
+    """Returns the per-side reduction the decode of ImageInfo needs (1 if none).
+
+    Raises ImageTooLarge if no reduced decode fits the budget.
+    """
+    reduction = 1
+    # Sides that do not divide evenly decode rounded up, so count those pixels
+    while math.ceil(info.width / reduction) * math.ceil(info.height / reduction) > _max_megapixels * 1e6:
+        reduction *= 2
+        if info.format != 'JPEG' or reduction > MAX_REDUCTION:
+            raise _too_large(info.width, info.height)
+    return reduction
+
+
+def _too_large(width, height):
+    return ImageTooLarge(f"Image is {width}x{height} ({width * height / 1e6:.0f} MP), "
+                         f"the limit is {_max_megapixels:g} MP")
+
+
+def _reduce(image, size=None):
+    """Sets up the decode of an opened image within the pixel budget.
+
+    size optionally asks for a smaller decode the caller can still use;
+    both only take effect for JPEG (draft mode). Returns the scale from
+    stored to decoded pixels as (fx, fy). Raises ImageTooLarge if the
+    image cannot be decoded within the budget.
+    """
+    width, height = image.size
+    reduction = check_pixel_budget(ImageInfo(width, height, image.format))
+    if reduction > 1:
+        # draft() picks the largest scale with width // scale >= the requested
+        # width, so ask for the floor: ceil() would select a smaller scale
+        limit = (max(1, width // reduction), max(1, height // reduction))
+        size = limit if size is None else (min(size[0], limit[0]), min(size[1], limit[1]))
+    if size is not None and image.format == 'JPEG':
+        image.draft(image.mode, size)
+    if image.size[0] * image.size[1] > _max_megapixels * 1e6:
+        raise _too_large(width, height)
+    return image.size[0] / width, image.size[1] / height
+
+
+def probe(data):
+    """Returns ImageInfo of encoded image, read from headers only (no pixel decode)"""
+    image = _open(data)
+    return ImageInfo(image.size[0], image.size[1], image.format, get_exif_orientation(image))
+
+
+def open_bounded(data):
+    """Opens an encoded image whose decode stays within the pixel budget"""
+    image = _open(data)
+    _reduce(image)
+    return image
+
+
+# Function to fix image orientation
+def fix_image_orientation(image):
+    """Fixes image orientation based on EXIF data"""
+    try:
+        from PIL import ImageOps
+        return ImageOps.exif_transpose(image)
+    except Exception:
+        return image
+
+
+# Function to compute 9:16 crop box with custom position
+def crop_box_9_16(size, crop_position='center'):
+    """Returns (left, top, right, bottom) of the 9:16 crop for an image size"""
+    target_ratio = 9 / 16
+    width, height = size
+    current_ratio = width / height
+
+    if current_ratio > target_ratio:
+        # Image too wide, crop sides
+        new_width = int(height * target_ratio)
+        if crop_position == 'left':
+            left = 0
+        elif crop_position == 'right':
+            left = width - new_width
+        else:  # center
+            left = (width - new_width) // 2
+        return (left, 0, left + new_width, height)
+    elif current_ratio < target_ratio:
+        # Image too tall, crop top and bottom
+        new_height = int(width / target_ratio)
+        if crop_position == 'top':
+            top = 0
+        elif crop_position == 'bottom':
+            top = height - new_height
+        else:  # center
+            top = (height - new_height) // 2
+        return (0, top, width, top + new_height)
+
+    return (0, 0, width, height)
+
+
+# Function to crop image to 9:16 with custom position
+def crop_to_9_16(image, crop_position='center'):
+    """Crops image to 9:16 format with adjustable position"""
+    box = crop_box_9_16(image.size, crop_position)
+    if box == (0, 0) + image.size:
+        return image
+    return image.crop(box)
+
+
+# Function to resize to final dimensions
+def resize_to_final(image, size=FINAL_SIZE):
+    """Resizes image to 1080x1920"""
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+# Function to crop and resize in a single resample pass
+def crop_and_resize(image, crop_position='center', size=FINAL_SIZE):
+    """Crops to 9:16 and resizes without materialising the cropped copy"""
+    box = crop_box_9_16(image.size, crop_position)
+    return image.resize(size, Image.Resampling.LANCZOS, box=box)
+
+
+# Combined function for backward compatibility
+def fix_image_orientation_and_resize(image, crop_position='center'):
+    """Fixes orientation, crops to 9:16, and resizes"""
+    image = fix_image_orientation(image)
+    return crop_and_resize(image, crop_position)
+
+
+# Function to encode image into bytes
+def encode_image(image, format='PNG', **options):
+    """Encodes image into bytes in the given format"""
+    buf = io.BytesIO()
+    image.save(buf, format=format, **options)
+    return buf.getvalue()
+
+
+# Function to read EXIF orientation without decoding pixels
+def get_exif_orientation(image):
+    """Returns EXIF orientation value (1 when missing or unreadable)"""
+    # Pillow decodes a whole PNG looking for an eXIf chunk after the image
+    # data; only the one before it (the usual place) is read here
+    if image.format == 'PNG' and 'exif' not in image.info:
+        return 1
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+# Function to read oriented size of encoded image
+def get_oriented_size(data):
+    """Returns image size after EXIF orientation fix, read from headers only"""
+    return probe(data).oriented_size
+
+
+# Function to check if encoded image already has the final size
+def is_final_image(data, size=FINAL_SIZE):
+    """True if image is exactly size and needs no EXIF rotation, read from headers only"""
+    info = probe(data)
+    return (info.width, info.height) == tuple(size) and info.orientation == 1
+
+
+# Function to map a box through a transpose
+def transpose_box(box, size, method):
+    """Maps a box on an image of given size to its position after transpose"""
+    width, height = size
+    left, top, right, bottom = box
+    if method == Image.Transpose.FLIP_LEFT_RIGHT:
+        xs, ys = (width - left, width - right), (top, bottom)
+    elif method == Image.Transpose.FLIP_TOP_BOTTOM:
+        xs, ys = (left, right), (height - top, height - bottom)
+    elif method == Image.Transpose.ROTATE_180:
+        xs, ys = (width - left, width - right), (height - top, height - bottom)
+    elif method == Image.Transpose.ROTATE_90:
+        xs, ys = (top, bottom), (width - left, width - right)
+    elif method == Image.Transpose.ROTATE_270:
+        xs, ys = (height - top, height - bottom), (left, right)
+    elif method == Image.Transpose.TRANSPOSE:
+        xs, ys = (top, bottom), (left, right)
+    elif method == Image.Transpose.TRANSVERSE:
+        xs, ys = (height - top, height - bottom), (width - left, width - right)
+    else:
+        return box
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+# Function to decode only the pixels the 9:16 output needs
+def load_9_16(data, crop_position='center', size=FINAL_SIZE):
+    """Decodes upload at reduced resolution, crops and resizes to 9:16, then fixes orientation.
+
+    The crop is computed in display (EXIF-oriented) coordinates and mapped
+    back onto the stored bitmap, so the rotation is applied to the small
+    final image instead of the full-size decode. JPEG uploads are decoded
+    with draft mode (DCT scaling by 1/2, 1/4 or 1/8) as long as the crop
+    still covers the target size, and always within the pixel budget.
+    Crop and resize happen in one resample call, so the only full-size
+    allocation is the decode itself.
+    """
+    image = _open(data)
+    method = ORIENTATION_TRANSPOSE.get(get_exif_orientation(image))
+    raw_size = image.size
+    swapped = method in (Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE,
+                         Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270)
+    oriented_size = (raw_size[1], raw_size[0]) if swapped else raw_size
+    raw_target = (size[1], size[0]) if swapped else size
+
+    box = crop_box_9_16(oriented_size, crop_position)
+    box = transpose_box(box, oriented_size, TRANSPOSE_INVERSE.get(method, method))
+
+    # Let the JPEG decoder downscale while the crop still covers the target
+    scale = min((box[2] - box[0]) / raw_target[0], (box[3] - box[1]) / raw_target[1])
+    draft_size = None
+    if scale >= 2:
+        draft_size = (math.ceil(raw_size[0] / scale), math.ceil(raw_size[1] / scale))
+    fx, fy = _reduce(image, draft_size)
+    box = (box[0] * fx, box[1] * fy, box[2] * fx, box[3] * fy)
+
+    image = image.resize(raw_target, Image.Resampling.LANCZOS, box=box)
+    if method is not None:
+        image = image.transpose(method)
+    return image
+
+
+# Function to decode a small base image for crop previews
+def load_preview_base(data, size=PREVIEW_SIZE):
+    """Decodes upload just large enough that any 9:16 crop covers the preview size.
+
+    The result is EXIF-oriented and can be re-cropped with render_preview
+    for every crop position without touching the original upload again.
+    """
+    image = _open(data)
+    width, height = image.size
+    info = ImageInfo(width, height, image.format, get_exif_orientation(image))
+    box = crop_box_9_16(info.oriented_size, 'center')
+    scale = min((box[2] - box[0]) / size[0], (box[3] - box[1]) / size[1])
+    target = (math.ceil(width / scale), math.ceil(height / scale)) if scale > 1 else None
+    _reduce(image, target)
+    if target is not None:
+        image.thumbnail(target, Image.Resampling.LANCZOS)
+    return fix_image_orientation(image)
+
+
+# Function to render a crop preview from a base image
+def render_preview(base, crop_position='center', size=PREVIEW_SIZE,
+                   format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+    """Crops preview base to 9:16 and encodes a small JPEG/WebP thumbnail"""
+    image = crop_and_resize(base, crop_position, size)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return encode_image(image, format, quality=quality)
+
+
+# Bytes-in/bytes-out pipeline for uploads
+def render_thumbnail(data, size=PREVIEW_SIZE[1], format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+    """Encodes the whole (uncropped) upload as a small oriented thumbnail"""
+    image = open_bounded(data)
+    # thumbnail() uses JPEG draft mode, so large photos are never fully decoded
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    image = fix_image_orientation(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return encode_image(image, format, quality=quality)
+
+
+def process_upload(data, crop_position='center', size=FINAL_SIZE, format='PNG'):
+    """Decodes upload, crops to 9:16, resizes, fixes orientation and encodes"""
+    return encode_image(load_9_16(data, crop_position, size), format)
+
+
+# Batch variants
+def crop_to_9_16_batch(images, crop_position='center'):
+    """Crops each image to 9:16 format"""
+    return [crop_to_9_16(image, crop_position) for image in images]
+
+
+def resize_to_final_batch(images, size=FINAL_SIZE):
+    """Resizes each image to final dimensions"""
+    return [resize_to_final(image, size) for image in images]
+
+
+def fix_image_orientation_and_resize_batch(images, crop_position='center'):
+    """Fixes orientation, crops to 9:16, and resizes each image"""
+    return [fix_image_orientation_and_resize(image, crop_position) for image in images]
+
+
+def process_upload_batch(items, size=FINAL_SIZE, format='PNG'):
+    """Runs process_upload over (data, crop_position) pairs"""
+    return [process_upload(data, crop_position, size, format) for data, crop_position in items]
@@ -0,0 +1,370 @@
+"""Background job subsystem that owns Replicate prediction lifecycles.
+
+Streamlit scripts submit a job and keep only its id in session state. A
+bounded worker pool creates the prediction, polls it until it finishes
+(a stand-in for webhooks), runs an optional postprocess step such as
+downloading results, and keeps the outcome until a later rerun collects
+it. A rerun or a disconnected browser no longer throws the work away.
+Predictions wait for a slot from the process-wide rate limiter
+(refacer.limits) first; job.queue_position shows where they stand.
+Submissions with the same key as a job still in flight attach to that
+job instead of starting a second prediction (single-flight).
+
+Output items (result URLs) are handed to an optional per-item processor
+as soon as they appear in the prediction output, while the prediction
+is still running for models that stream partial outputs. The UI can
+show job.partial_results() before the job finishes.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from refacer import limits, metrics
+
+QUEUED = 'queued'
+STARTING = 'starting'
+PROCESSING = 'processing'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELED = 'canceled'
+TERMINAL_STATUSES = (SUCCEEDED, FAILED, CANCELED)
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_POLL_INTERVAL = 1.0
+# Finished jobs are kept this long for sessions to collect them
+DEFAULT_RETENTION_SECONDS = 60 * 60
+# Replicate deletes prediction outputs an hour after the prediction is created
+OUTPUT_URL_SECONDS = 60 * 60
+
+
+class Job:
+    """State of one prediction as seen by the UI"""
+
+    def __init__(self, model, input, postprocess=None, on_success=None, session='', key=None,
+                 on_item=None, max_items=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.model = model
+        self.input = input
+        self.postprocess = postprocess
+        self.on_success = on_success
+        self.on_item = on_item
+        self.max_items = max_items
+        # Futures of on_item, one per output item in output order
+        self.items = []
+        self.session = session
+        self.status = QUEUED
+        self.queue_position = None
+        self.prediction_id = None
+        self.logs = ''
+        self.output = None
+        # Until then the output URLs can be fetched from the provider
+        self.output_expires = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.timings = {}
+        self.cancel_requested = False
+        self.cached = False
+        # Sessions sharing this job; cancel only once all of them gave up.
+        # Repeat submits from one session (a double click) count once
+        self.subscribers = {session}
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+    @property
+    def elapsed(self):
+        """Seconds since submission (or until completion)"""
+        return (self.finished_at or time.time()) - self.created_at
+
+    def partial_results(self):
+        """Returns on_item results processed so far, in output order"""
+        return [f.result() for f in list(self.items) if f.done() and f.exception() is None]
+
+    def _item_done(self, future):
+        if future.exception() is None and 'first_result' not in self.timings:
+            self.timings['first_result'] = time.time() - self.created_at
+            metrics.observe('first_result', self.timings['first_result'], self.model)
+
+
+class LazyClient:
+    """replicate.Client that imports replicate and connects on first use.
+
+    Importing replicate (httpx, pydantic) costs about 0.3 s, which every
+    cold start would pay even for visitors who never generate anything.
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        with self._lock:
+            if self._client is None:
+                import replicate
+
+                self._client = replicate.Client(**self._kwargs)
+        return getattr(self._client, name)
+
+
+class PredictionError(Exception):
+    """Prediction finished as failed or canceled"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def rewind_inputs(input):
+    """Seeks file inputs back to the start, so a retried request sends them again"""
+    for value in input.values():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            if hasattr(item, 'seek'):
+                item.seek(0)
+
+
+def input_bytes(input):
+    """Request payload of file inputs, which are sent inline as base64"""
+    total = 0
+    for value in input.values():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            if hasattr(item, 'getbuffer'):
+                total += -(-item.getbuffer().nbytes // 3) * 4
+    return total
+
+
+def output_items(output):
+    """Returns prediction output as a list; models return one URL or a list"""
+    if output is None:
+        return []
+    if isinstance(output, (list, tuple)):
+        return list(output)
+    return [output]
+
+
+def _stream_items(job, output):
+    """Starts job.on_item for output items that appeared since the last poll"""
+    if job.on_item is None:
+        return
+    from refacer.downloads import get_executor
+
+    items = output_items(output)[:job.max_items]
+    for item in items[len(job.items):]:
+        future = get_executor().submit(job.on_item, item)
+        job.items.append(future)
+        future.add_done_callback(job._item_done)
+
+
+def run_prediction(client, model, input, poll_interval=DEFAULT_POLL_INTERVAL, job=None, session=''):
+    """Creates a prediction and polls it until it finishes, returns its output.
+
+    The call first waits for a slot from the model's rate limiter, fairly
+    shared across sessions; requests that hit a 429 or a 5xx are retried
+    with jittered backoff. When a Job is given, its status, queue
+    position, logs, prediction id, timings and output so far follow the
+    prediction, job.on_item starts on each output item as soon as it
+    appears, and job.cancel_requested cancels it. Timings split the prediction into
+    wait (for a limiter slot), upload (the create request), queue (until
+    the model starts processing) and inference. Raises PredictionError if
+    the prediction fails, is canceled or stays rate limited.
+    """
+    job = job if job is not None else Job(model, input, session=session)
+    wait_start = time.perf_counter()
+    try:
+        with limits.get_governor().slot(
+            model, job.session,
+            on_position=lambda position: setattr(job, 'queue_position', position or None),
+            canceled=lambda: job.cancel_requested,
+        ) as limiter:
+            job.timings['wait'] = time.perf_counter() - wait_start
+            metrics.observe('wait', job.timings['wait'], model)
+            job.status = STARTING
+            return _create_and_poll(client, model, input, poll_interval, job, limiter)
+    except limits.QueueCanceled:
+        raise PredictionError(CANCELED, f"Prediction {CANCELED}")
+    except PredictionError:
+        raise
+    except Exception as e:
+        if getattr(e, 'status', None) == 429:
+            raise PredictionError(FAILED, "Replicate is rate limiting requests, please try again in a minute")
+        raise
+
+
+def _create_and_poll(client, model, input, poll_interval, job, limiter):
+    def create():
+        rewind_inputs(input)
+        return client.models.predictions.create(model=model, input=input)
+
+    metrics.BYTES.inc(input_bytes(input), direction='upload', model=model)
+    start = time.perf_counter()
+    prediction = limits.retry_call(limiter, create)
+    limiter.accepted()
+    job.output_expires = time.time() + OUTPUT_URL_SECONDS
+    # File inputs are sent inline with the create request
+    created = time.perf_counter()
+    job.timings['upload'] = created - start
+    job.prediction_id = prediction.id
+    job.status = prediction.status if prediction.status not in TERMINAL_STATUSES else PROCESSING
+
+    processing = created if prediction.status == PROCESSING else None
+    while prediction.status not in TERMINAL_STATUSES:
+        if job.cancel_requested:
+            limits.retry_call(limiter, prediction.cancel)
+        time.sleep(poll_interval)
+        limits.retry_call(limiter, prediction.reload)
+        if processing is None and prediction.status != STARTING:
+            processing = time.perf_counter()
+        # The terminal status is set by JobManager together with finished_at
+        job.status = prediction.status if prediction.status not in TERMINAL_STATUSES else PROCESSING
+        job.logs = prediction.logs or ''
+        if prediction.status in (PROCESSING, SUCCEEDED):
+            # Partial output of streaming models, or the final output
+            job.output = prediction.output
+            _stream_items(job, prediction.output)
+    if prediction.status == SUCCEEDED:
+        _stream_items(job, prediction.output)
+    finished = time.perf_counter()
+    processing = processing or finished
+    job.timings['prediction'] = finished - start
+    job.timings['queue'] = processing - created
+    job.timings['inference'] = finished - processing
+    for stage in ('upload', 'queue', 'inference'):
+        metrics.observe(stage, job.timings[stage], model)
+
+    if prediction.status != SUCCEEDED:
+        raise PredictionError(prediction.status, prediction.error or f"Prediction {prediction.status}")
+    return prediction.output
+
+
+class JobManager:
+    """Runs predictions on a bounded worker pool and tracks them by job id"""
+
+    def __init__(self, client, max_workers=DEFAULT_MAX_WORKERS,
+                 poll_interval=DEFAULT_POLL_INTERVAL,
+                 retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='prediction')
+
+    def submit(self, model, input, postprocess=None, on_success=None, session='', key=None,
+               on_item=None, max_items=None):
+        """Queues a prediction, returns its job id.
+
+        postprocess(output) runs on the worker thread after the prediction
+        succeeds; its return value becomes job.result. With on_item, each of
+        the first max_items output items is processed by on_item(item) on the
+        download pool as soon as it appears, and postprocess receives the
+        list of their futures instead of the output. on_success(job) runs
+        afterwards, e.g. to store the result in a cache. session identifies
+        the submitter for fair queueing in the rate limiter. If key matches
+        a job that has not finished yet, that job's id is returned instead;
+        key must therefore cover everything that shapes job.result.
+        """
+        with self._lock:
+            inflight = self._inflight.get(key) if key is not None else None
+            if inflight is not None and not inflight.done and not inflight.cancel_requested:
+                inflight.subscribers.add(session)
+                metrics.COALESCED.inc(model=model)
+                return inflight.id
+            job = Job(model, input, postprocess, on_success, session, key, on_item, max_items)
+            self._prune()
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def add_completed(self, model, result, cached=True, timings=None, output=None, output_expires=None):
+        """Registers an already finished job (e.g. a cache hit), returns its id"""
+        job = Job(model, None)
+        job.result = result
+        job.output = output
+        job.output_expires = output_expires
+        job.cached = cached
+        job.finished_at = time.time()
+        job.status = SUCCEEDED
+        job.timings.update(timings or {})
+        job.timings['total'] = 0.0
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job.id
+
+    def get(self, job_id):
+        """Returns Job by id, or None if unknown or pruned"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, session=''):
+        """Drops the session from the job's subscribers; cancels the
+        prediction once no session still waits on it"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.subscribers.discard(session)
+                if not job.subscribers:
+                    job.cancel_requested = True
+
+    def stats(self):
+        """Returns number of jobs per status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.done and j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        # Published in finally, after finished_at: a done job always has it
+        status = FAILED
+        try:
+            if job.cancel_requested:
+                job.error = f"Prediction {CANCELED}"
+                status = CANCELED
+                return
+            job.output = run_prediction(self.client, job.model, job.input, self.poll_interval, job)
+            if job.postprocess is not None:
+                postprocess_start = time.perf_counter()
+                job.result = job.postprocess(job.items if job.on_item is not None else job.output)
+                job.timings['postprocess'] = time.perf_counter() - postprocess_start
+                metrics.observe('postprocess', job.timings['postprocess'], job.model)
+            else:
+                job.result = job.output
+            job.timings['total'] = time.time() - job.created_at
+            if job.on_success is not None:
+                try:
+                    job.on_success(job)
+                except Exception:
+                    pass  # e.g. a failed cache write must not fail a finished prediction
+            status = SUCCEEDED
+        except PredictionError as e:
+            job.error = str(e)
+            status = e.status
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            job.input = None
+            job.finished_at = time.time()
+            job.timings['total'] = job.finished_at - job.created_at
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                job.status = status
+            metrics.observe('total', job.timings['total'], job.model)
+            metrics.JOBS.inc(status=status, model=job.model)
@@ -0,0 +1,231 @@
+"""Process-wide rate limiting and concurrency governor for Replicate calls.
+
+Every prediction of a model passes through that model's ModelLimiter. The
+limiter hands out slots in a fair order, round-robin across sessions, so
+one session's burst cannot starve the others. A slot is granted only when
+a concurrency slot is free and the model's token bucket has a token for
+the create request. A 429 from the provider pauses the whole bucket for
+the backoff delay, not just the request that got it, and halves the
+bucket rate. Each accepted request then raises the rate again by a small
+step, up to the configured limit. This keeps sustained throughput at the
+provider's actual limit instead of swinging between bursts and failures.
+Waiters can see their 1-based position in the queue.
+
+    with get_governor().slot('google/nano-banana', session='abc', on_position=print):
+        ...  # create and poll the prediction
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Statuses worth retrying: rate limited or a transient provider error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# Rate recovery per accepted request, as a fraction of the configured rate
+RATE_RECOVERY_STEP = 0.05
+# The rate never drops below this fraction of the configured rate
+RATE_FLOOR = 0.05
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Requests per minute with a burst allowance, plus concurrent predictions"""
+    per_minute: float = 600
+    burst: int = 10
+    concurrency: int = 16
+
+
+DEFAULT_LIMITS = {
+    'google/nano-banana': Limit(per_minute=600, burst=10, concurrency=16),
+    'wan-video/wan-2.2-i2v-fast': Limit(per_minute=600, burst=5, concurrency=8),
+}
+
+
+class QueueCanceled(Exception):
+    """Waiter gave up (e.g. the job was canceled) before getting a slot"""
+
+
+class TokenBucket:
+    """Token bucket that can be paused after the provider pushes back"""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self):
+        """Takes a token and returns 0, or returns seconds until one is available.
+
+        Not thread-safe on its own; ModelLimiter calls it under its lock.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hands out no tokens for the given time and halves the rate"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.rate = max(self.max_rate * RATE_FLOOR, self.rate / 2)
+
+    def recover(self):
+        """Raises the rate one step back towards the configured limit"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP)
+
+
+class ModelLimiter:
+    """Fair queue, token bucket and concurrency cap for one model"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.bucket = TokenBucket(limit.per_minute / 60, limit.burst)
+        self.active = 0
+        self._queues = OrderedDict()  # session -> deque of tickets, in round-robin order
+        self._cond = threading.Condition()
+
+    def _order(self):
+        """Waiting tickets in the order they will be served"""
+        queues = list(self._queues.values())
+        order = []
+        for depth in range(max((len(q) for q in queues), default=0)):
+            order.extend(q[depth] for q in queues if depth < len(q))
+        return order
+
+    def acquire(self, session='', on_position=None, canceled=None):
+        """Blocks until this caller may start a prediction.
+
+        on_position(n) is called with the 1-based queue position while
+        waiting and with 0 once the slot is granted. canceled() is checked
+        while waiting; QueueCanceled is raised when it returns True.
+        """
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(session, deque()).append(ticket)
+            try:
+                while True:
+                    position = self._order().index(ticket)
+                    wait = 1.0
+                    if position == 0 and self.active < self.limit.concurrency:
+                        wait = self.bucket.reserve()
+                        if wait == 0:
+                            break
+                    if on_position is not None:
+                        on_position(position + 1)
+                    if canceled is not None and canceled():
+                        raise QueueCanceled()
+                    self._cond.wait(timeout=min(wait, 1.0))
+                self.active += 1
+            finally:
+                queue = self._queues[session]
+                queue.remove(ticket)
+                if queue:
+                    self._queues.move_to_end(session)  # next turn goes to other sessions
+                else:
+                    del self._queues[session]
+                self._cond.notify_all()
+        if on_position is not None:
+            on_position(0)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def accepted(self):
+        """Records a request the provider accepted"""
+        with self._cond:
+            self.bucket.recover()
+
+    def backoff(self, status, attempt):
+        """Sleeps a jittered exponential delay; a 429 pauses the whole bucket"""
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if status == 429:
+            with self._cond:
+                self.bucket.pause(delay)
+        time.sleep(delay)
+
+    def stats(self):
+        """Returns (active predictions, waiting callers)"""
+        with self._cond:
+            return self.active, sum(len(q) for q in self._queues.values())
+
+
+class Governor:
+    """ModelLimiters by model name, created on first use"""
+
+    def __init__(self, limits=None, default=Limit()):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.default = default
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model):
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = ModelLimiter(self.limits.get(model, self.default))
+            return self._limiters[model]
+
+    @contextmanager
+    def slot(self, model, session='', on_position=None, canceled=None):
+        """Holds one of the model's prediction slots for the enclosed block"""
+        limiter = self.limiter(model)
+        limiter.acquire(session, on_position, canceled)
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def stats(self):
+        """Returns {model: (active, waiting)}"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model: limiter.stats() for model, limiter in limiters.items()}
+
+
+def retry_call(limiter, call):
+    """Runs call(), retrying with backoff on rate limits and transient errors"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return call()
+        except Exception as e:
+            status = getattr(e, 'status', None)
+            if status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                raise
+            limiter.backoff(status, attempt)
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def configure(limits=None):
+    """Replaces the process-wide governor; limits maps model to Limit"""
+    global _governor
+    with _governor_lock:
+        _governor = Governor(limits)
+        return _governor
+
+
+def get_governor():
+    """Returns the process-wide governor, creating the default one on first use"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+        return _governor
@@ -0,0 +1,117 @@
+"""Disk-backed media store with content-hashed names, TTL and size cleanup.
+
+Large artifacts (generated videos) are streamed to disk in chunks and
+referenced from session state by a small MediaHandle, so their bytes never
+sit in server memory. When the store lives under the app's ``static``
+directory, Streamlit serves the files directly at ``app/static/...``.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class MediaHandle:
+    """Reference to a stored file: content-hashed name, size and MIME type"""
+    name: str
+    size: int
+    mime: str
+
+
+class MediaStore:
+    """Directory of content-addressed files, pruned by age and total size.
+
+    ttl_seconds=None keeps files until the size limit is reached.
+    """
+
+    def __init__(self, root, url_prefix='', ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, handle):
+        """Filesystem path of a stored file"""
+        return os.path.join(self.root, handle.name)
+
+    def url(self, handle):
+        """URL of a stored file; the name is content-hashed, so it never changes.
+
+        The ``v`` query argument makes Tornado's static handler send a
+        far-future Cache-Control header.
+        """
+        return f"{self.url_prefix}/{handle.name}?v={handle.name[:8]}"
+
+    def exists(self, handle):
+        """True if the file has not been cleaned up yet"""
+        return handle is not None and os.path.exists(self.path(handle))
+
+    def save_stream(self, chunks, extension, mime='application/octet-stream'):
+        """Writes an iterable of byte chunks to the store, returns its MediaHandle"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            handle = MediaHandle(f"{digest.hexdigest()[:32]}.{extension}", size, mime)
+            os.replace(tmp_path, self.path(handle))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.cleanup(keep=handle.name)
+        return handle
+
+    def save_file(self, path, extension, mime='application/octet-stream', chunk_size=1024 * 1024):
+        """Copies a file into the store in chunks, returns MediaHandle"""
+        with open(path, 'rb') as f:
+            return self.save_stream(iter(lambda: f.read(chunk_size), b''), extension, mime)
+
+    def save_bytes(self, data, extension, mime='application/octet-stream'):
+        """Stores bytes, returns MediaHandle"""
+        return self.save_stream([data], extension, mime)
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith('.part'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def cleanup(self, keep=None):
+        """Removes files older than the TTL, then oldest files until under max_bytes"""
+        with self._lock:
+            entries = self._entries()
+            now = time.time()
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                if os.path.basename(path) == keep:
+                    continue
+                expired = self.ttl_seconds is not None and now - mtime > self.ttl_seconds
+                if expired or total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self):
+        """Returns (file count, total bytes)"""
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
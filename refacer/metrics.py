@@ -0,0 +1,218 @@
+"""Process-wide pipeline metrics in the Prometheus text format.
+
+Stages of the image and WAN flows record timing spans into labelled
+histograms; byte and cache counters sit alongside them. Nothing here
+depends on prometheus_client: render() produces the text exposition
+format, which start_exporter() serves on a local port (scrape
+``/metrics``) and/or writes to a file for node_exporter's textfile
+collector.
+
+    with metrics.span('preprocess'):
+        ...
+    metrics.observe('inference', seconds, model='google/nano-banana')
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers fast local stages up to slow video predictions
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+DEFAULT_EXPORT_INTERVAL = 15
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, with labels"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            counts, _ = self._values.get(key, ([0], 0.0))
+            return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                    samples.append((f"{self.name}_bucket", labels, cumulative))
+                samples.append((f"{self.name}_sum", _format_labels(self.labels, key), total))
+                samples.append((f"{self.name}_count", _format_labels(self.labels, key), cumulative))
+        return samples
+
+
+class Registry:
+    """Set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'refacer_stage_seconds', 'Time spent per pipeline stage', ('stage', 'model')))
+BYTES = REGISTRY.register(Counter(
+    'refacer_bytes_total', 'Bytes sent to and received from Replicate', ('direction', 'model')))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'refacer_result_cache_lookups_total', 'Result cache lookups', ('result', 'model')))
+JOBS = REGISTRY.register(Counter(
+    'refacer_jobs_total', 'Finished prediction jobs', ('status', 'model')))
+COALESCED = REGISTRY.register(Counter(
+    'refacer_coalesced_total', 'Submissions attached to an identical in-flight job', ('model',)))
+SESSION_MEDIA_BYTES = REGISTRY.register(Gauge(
+    'refacer_session_media_bytes', 'Bytes of session media held in memory or spilled to disk', ('tier',)))
+SESSION_MEDIA_SESSIONS = REGISTRY.register(Gauge(
+    'refacer_session_media_sessions', 'Sessions holding session media in memory'))
+SESSION_MEDIA_SPILLS = REGISTRY.register(Counter(
+    'refacer_session_media_spills_total', 'Session media moved from memory to disk', ('reason',)))
+
+
+def observe(stage, seconds, model=''):
+    """Records a stage duration measured elsewhere"""
+    STAGE_SECONDS.observe(seconds, stage=stage, model=model)
+
+
+@contextmanager
+def span(stage, model=''):
+    """Times the enclosed block as one observation of the stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, model)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the server log
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Atomically writes the metrics to path"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_exporter(port=None, path=None, interval=DEFAULT_EXPORT_INTERVAL, host='127.0.0.1'):
+    """Serves /metrics on host:port and/or rewrites path every interval seconds"""
+    if port:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    if path:
+        def write_forever():
+            while True:
+                try:
+                    write_textfile(path)
+                except OSError:
+                    pass  # e.g. disk full; retry on the next tick
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name='metrics-file', daemon=True).start()
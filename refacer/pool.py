@@ -0,0 +1,240 @@
+"""Shared, bounded worker pool for CPU-bound image work.
+
+Streamlit runs every session on its own thread of one interpreter, so
+decode/crop/resize/encode calls from concurrent sessions contend for the
+GIL. Routing them through one process-wide pool lets throughput scale
+with cores. A bounded number of pending tasks provides backpressure:
+when the pool is saturated, submit() waits (up to a timeout) instead of
+queueing unbounded work and memory.
+
+The default kind='thread' stays in-process: Pillow releases the GIL
+inside most decoders, resamplers and encoders, and on one core a process
+pool only adds pickling (see benchmarks.bench_pool). kind='process' can
+pull ahead on multi-core hosts. Process pools use the ``spawn`` start
+method, since forking a multi-threaded server is unsafe. Spawned
+children normally re-run the parent's __main__, which under Streamlit is
+app.py itself; workers are started with a blank __main__ instead and
+only import this package.
+
+Pools get one worker per CPU the process may actually use: in a
+container, os.cpu_count() reports the host's cores, not the affinity
+mask or the cgroup CPU quota.
+"""
+
+import math
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.context import SpawnContext, SpawnProcess
+
+from refacer.encoding import encode, from_bytes
+from refacer.imaging import (
+    FINAL_SIZE,
+    fix_image_orientation,
+    is_final_image,
+    load_9_16,
+    open_bounded,
+    set_pixel_budget,
+)
+
+DEFAULT_KIND = 'thread'
+# Seconds submit() waits for a free slot before giving up
+DEFAULT_SUBMIT_TIMEOUT = 30
+
+
+class PoolBusy(RuntimeError):
+    """No free slot in the image pool within the submit timeout"""
+
+
+def _cgroup_cpu_quota():
+    """Returns the cgroup CPU quota in CPUs (v2, then v1), or None if unlimited"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus():
+    """Returns the number of CPUs this process may use (affinity mask and cgroup quota)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS and Windows
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+_blank_main = types.ModuleType('__main__')
+_main_lock = threading.Lock()
+
+
+class _WorkerProcess(SpawnProcess):
+    """Spawned process that does not re-run the parent's main script"""
+
+    @staticmethod
+    def _Popen(process_obj):
+        # Preparation data (incl. the main script path) is read from
+        # sys.modules['__main__'] while the child is launched
+        with _main_lock:
+            main, sys.modules['__main__'] = sys.modules['__main__'], _blank_main
+            try:
+                return SpawnProcess._Popen(process_obj)
+            finally:
+                sys.modules['__main__'] = main
+
+
+class _WorkerContext(SpawnContext):
+    Process = _WorkerProcess
+
+
+class BoundedPool:
+    """Executor wrapper whose submit() blocks while max_pending tasks are in flight"""
+
+    def __init__(self, kind=DEFAULT_KIND, max_workers=None, max_pending=None, max_megapixels=None):
+        self.kind = kind
+        # Decode budget of worker processes (see refacer.imaging)
+        self.max_megapixels = max_megapixels
+        self.max_workers = max_workers or available_cpus()
+        self.max_pending = max_pending or self.max_workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='image')
+                else:
+                    initargs = () if self.max_megapixels is None else (self.max_megapixels,)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=_WorkerContext(),
+                        initializer=set_pixel_budget,
+                        initargs=initargs)
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args, timeout=DEFAULT_SUBMIT_TIMEOUT):
+        """Submits fn(*args), waiting for a free slot; raises PoolBusy on timeout"""
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolBusy("Image processing is busy, please try again")
+        with self._lock:
+            self.pending += 1
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool
+                self._reset(executor)
+                future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def run(self, fn, *args, timeout=DEFAULT_SUBMIT_TIMEOUT):
+        """Runs fn(*args) on the pool and returns its result"""
+        return self.submit(fn, *args, timeout=timeout).result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(kind=DEFAULT_KIND, max_workers=None, max_pending=None, max_megapixels=None):
+    """Replaces the process-wide pool (call once at startup).
+
+    max_megapixels sets the decode budget of this process and of the
+    pool's workers.
+    """
+    global _pool
+    if max_megapixels is not None:
+        set_pixel_budget(max_megapixels)
+    with _pool_lock:
+        old, _pool = _pool, BoundedPool(kind, max_workers, max_pending, max_megapixels)
+    if old is not None:
+        old.shutdown()
+    return _pool
+
+
+def get_pool():
+    """Returns the process-wide pool, creating the default one on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BoundedPool(os.environ.get('REFACER_IMAGE_POOL', DEFAULT_KIND))
+        return _pool
+
+
+def shutdown():
+    """Stops the process-wide pool's workers, e.g. before a child process exits"""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.shutdown()
+
+
+def run_in_pool(fn, *args):
+    """Runs a picklable module-level function on the shared pool"""
+    return get_pool().run(fn, *args)
+
+
+# Pool tasks: module-level and bytes-in so they pickle cheaply
+
+def prepare_upload(data, crop_position='center', size=FINAL_SIZE, encoding='png'):
+    """Decodes an upload, crops and resizes to 9:16, returns EncodedImage"""
+    return encode(load_9_16(data, crop_position, size), encoding)
+
+
+def prepare_input(data, encoding='png'):
+    """Decodes an upload and fixes its EXIF orientation (no crop), returns EncodedImage"""
+    return encode(fix_image_orientation(open_bounded(data)), encoding)
+
+
+def prepare_output(data, encoding='png'):
+    """Brings a model output to 9:16, returns EncodedImage.
+
+    Outputs that already are 1080x1920 and upright keep their original
+    bytes: no decode, resample or re-encode.
+    """
+    if is_final_image(data):
+        original = from_bytes(data)
+        if original is not None:
+            return original
+    return encode(load_9_16(data), encoding)
@@ -0,0 +1,176 @@
+"""Persistent, content-addressed cache of prediction results.
+
+Keys are SHA-256 over the model slug, the normalized prompt, digests of
+the prepared input buffers and any other model params, plus the local
+processing settings that shape the stored outputs, so an identical
+request (a rerun, a double click) maps to the stored outputs instead of a
+new paid prediction. Entries are directories of output files plus
+meta.json; the least recently used entries are evicted once the cache
+grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+META_FILE = 'meta.json'
+
+
+@dataclass
+class CacheEntry:
+    """Stored result: output file paths (in order) and metadata"""
+    key: str
+    paths: list
+    meta: dict
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace so trivially different prompts share a key"""
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+
+def _digest_value(name, value):
+    if hasattr(value, 'read'):
+        value.seek(0)
+        digest = hashlib.sha256(value.read()).hexdigest()
+        value.seek(0)
+        return {'sha256': digest}
+    if isinstance(value, (bytes, bytearray)):
+        return {'sha256': hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (list, tuple)):
+        return [_digest_value(name, v) for v in value]
+    if isinstance(value, str) and name == 'prompt':
+        return normalize_prompt(value)
+    return value
+
+
+def make_key(model, input, output=None):
+    """Returns cache key for a model and its input dict (file inputs are hashed).
+
+    output holds settings of the local processing of the outputs (e.g. the
+    download encoding): results processed differently get different keys.
+    """
+    payload = {'model': model,
+               'input': {name: _digest_value(name, value) for name, value in sorted(input.items())}}
+    if output:
+        payload['output'] = output
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    """On-disk result store with LRU eviction and hit/miss accounting"""
+
+    def __init__(self, root, max_bytes=DEFAULT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [last_used, size]
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_predictions = {}
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _scan(self):
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                meta_path = os.path.join(entry_dir, META_FILE)
+                if not os.path.exists(meta_path):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                size = sum(e.stat().st_size for e in os.scandir(entry_dir))
+                self._entries[key] = [os.path.getmtime(meta_path), size]
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def get(self, key):
+        """Returns CacheEntry and records a hit, or None and records a miss"""
+        with self._lock:
+            entry_dir = self._entry_dir(key)
+            meta_path = os.path.join(entry_dir, META_FILE)
+            if key not in self._entries or not os.path.exists(meta_path):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            with open(meta_path) as f:
+                meta = json.load(f)
+            now = time.time()
+            os.utime(meta_path, (now, now))
+            self._entries[key][0] = now
+            self.hits += 1
+            self.saved_seconds += meta.get('seconds', 0.0)
+            model = meta.get('model', '')
+            self.saved_predictions[model] = self.saved_predictions.get(model, 0) + 1
+            return CacheEntry(key, [os.path.join(entry_dir, name) for name in meta['files']], meta)
+
+    def put(self, key, blobs, meta):
+        """Stores outputs for key. blobs is a list of (extension, bytes or file path)."""
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        try:
+            names = []
+            for idx, (extension, blob) in enumerate(blobs):
+                name = f"{idx}.{extension}"
+                path = os.path.join(staging, name)
+                if isinstance(blob, (bytes, bytearray)):
+                    with open(path, 'wb') as f:
+                        f.write(blob)
+                else:
+                    try:
+                        os.link(blob, path)
+                    except OSError:
+                        shutil.copyfile(blob, path)
+                names.append(name)
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump(dict(meta, files=names, created_at=time.time()), f)
+            size = sum(e.stat().st_size for e in os.scandir(staging))
+
+            with self._lock:
+                entry_dir = self._entry_dir(key)
+                os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(staging, entry_dir)
+                self._entries[key] = [time.time(), size]
+                self._evict(keep=key)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self, keep=None):
+        total = self.total_bytes
+        for key, (_, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            del self._entries[key]
+            total -= size
+
+    def stats(self):
+        """Returns hit/miss counters, hit rate, saved latency and bytes stored"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': self.saved_seconds,
+            'saved_predictions': dict(self.saved_predictions),
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+        }
@@ -0,0 +1,258 @@
+"""Accounted, bounded storage for media that sessions keep between reruns.
+
+Session state used to hold result images and model input buffers
+directly, pinned in memory until the session expired, even in idle tabs.
+Sessions now keep a small MediaRef; SessionMedia holds the bytes in
+memory within a per-session and a process-wide byte budget. Beyond
+either budget, and for artifacts unused for idle_seconds, the least
+recently used bytes are spilled to a MediaStore on disk. Artifacts that
+get a disk copy through handle() (e.g. to be served by URL) leave memory
+right away. get() reads spilled artifacts from disk; once the store has
+aged their files out, it returns None. File I/O happens outside the
+lock, so sessions do not wait on each other's writes.
+
+Streamlit does not report ended sessions, so sweep(), run periodically
+by start_sweeper(), spills idle bytes even when no session stores
+anything, forgets artifacts unused for expire_seconds and those whose
+files the store has removed.
+
+    ref = session_media.put(session_id, 'result_0', data, 'png', 'image/png', 'PNG')
+    data = session_media.get(ref)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from refacer import metrics
+from refacer.media_store import DEFAULT_TTL_SECONDS
+
+MB = 1024 * 1024
+DEFAULT_SESSION_BYTES = 32 * MB
+DEFAULT_TOTAL_BYTES = 256 * MB
+DEFAULT_IDLE_SECONDS = 10 * 60
+# Artifacts unused this long belong to ended sessions; matches the store's TTL
+DEFAULT_EXPIRE_SECONDS = DEFAULT_TTL_SECONDS
+DEFAULT_SWEEP_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class MediaRef:
+    """Reference to a session artifact, kept in session state instead of its bytes"""
+    session: str
+    name: str
+    size: int
+    extension: str
+    mime: str
+    label: str = ''
+
+
+class _Entry:
+    def __init__(self, ref, data):
+        self.ref = ref
+        self.data = data  # None once on disk only
+        self.handle = None  # on-disk copy in the store
+        self.used = time.monotonic()
+        self.spilling = False  # a write to the store is in progress
+
+
+class SessionMedia:
+    """Per-session artifacts with LRU spill to a MediaStore"""
+
+    def __init__(self, store, session_bytes=DEFAULT_SESSION_BYTES, total_bytes=DEFAULT_TOTAL_BYTES,
+                 idle_seconds=DEFAULT_IDLE_SECONDS, expire_seconds=DEFAULT_EXPIRE_SECONDS):
+        self.store = store
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.idle_seconds = idle_seconds
+        self.expire_seconds = expire_seconds
+        self._entries = OrderedDict()  # (session, name) -> _Entry, least recently used first
+        self._memory = {}  # session -> bytes held in memory
+        self._lock = threading.Lock()
+
+    def put(self, session, name, data, extension, mime='application/octet-stream', label=''):
+        """Stores bytes under a name of the session, returns its MediaRef"""
+        ref = MediaRef(session, name, len(data), extension, mime, label)
+        with self._lock:
+            self._remove((session, name))
+            self._entries[(session, name)] = _Entry(ref, data)
+            self._memory[session] = self._memory.get(session, 0) + ref.size
+            victims = self._select_spills(session)
+        self._spill(victims)
+        return ref
+
+    def get(self, ref):
+        """Returns the bytes of a MediaRef, reading spilled ones from disk; None if gone"""
+        with self._lock:
+            entry = self._touch(ref)
+            if entry is None:
+                return None
+            if entry.data is not None:
+                return entry.data
+            handle = entry.handle
+        try:
+            with open(self.store.path(handle), 'rb') as f:
+                return f.read()
+        except OSError:
+            self._forget(entry)  # cleaned up by the store
+            return None
+
+    def handle(self, ref):
+        """Returns a MediaHandle of the artifact on disk (e.g. to serve it by URL), or None if gone.
+
+        The disk copy makes the bytes in memory redundant, so they are released.
+        """
+        with self._lock:
+            entry = self._touch(ref)
+            if entry is None:
+                return None
+            handle, data = entry.handle, entry.data
+        if not self.store.exists(handle):
+            if data is None:
+                self._forget(entry)
+                return None
+            handle = self.store.save_bytes(data, ref.extension, ref.mime)
+        with self._lock:
+            self._stored(entry, handle, 'published')
+            self._update_metrics()
+        return handle
+
+    def drop(self, session, names=None):
+        """Forgets the named artifacts of a session, or all of them"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == session and (names is None or key[1] in names):
+                    self._remove(key)
+            self._update_metrics()
+
+    def sweep(self):
+        """Spills idle artifacts, forgets expired ones and those whose files are gone"""
+        cutoff = time.monotonic() - self.expire_seconds
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if entry.used <= cutoff and not entry.spilling]:
+                self._remove(key)
+            victims = self._select_spills(None)
+            on_disk = [entry for entry in self._entries.values()
+                       if entry.data is None and not entry.spilling]
+        self._spill(victims)
+        for entry in on_disk:
+            if not self.store.exists(entry.handle):
+                self._forget(entry)  # cleaned up by the store
+        with self._lock:
+            self._update_metrics()
+
+    def start_sweeper(self, interval=DEFAULT_SWEEP_SECONDS):
+        """Runs sweep() every interval seconds on a daemon thread"""
+        def sweep_forever():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        threading.Thread(target=sweep_forever, name='session-media-sweep', daemon=True).start()
+
+    def stats(self):
+        """Returns dict with bytes in memory and on disk, sessions and artifacts"""
+        with self._lock:
+            return {
+                'memory_bytes': sum(self._memory.values()),
+                'disk_bytes': sum(e.ref.size for e in self._entries.values() if e.data is None),
+                'sessions': sum(1 for size in self._memory.values() if size),
+                'artifacts': len(self._entries),
+            }
+
+    def session_stats(self, session):
+        """Returns (bytes in memory, bytes on disk) of one session"""
+        with self._lock:
+            on_disk = sum(e.ref.size for key, e in self._entries.items()
+                          if key[0] == session and e.data is None)
+            return self._memory.get(session, 0), on_disk
+
+    def _touch(self, ref):
+        key = (ref.session, ref.name)
+        entry = self._entries.get(key)
+        if entry is None or entry.ref != ref:
+            return None  # replaced by a newer artifact of the same name
+        entry.used = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def _forget(self, entry):
+        with self._lock:
+            key = (entry.ref.session, entry.ref.name)
+            if self._entries.get(key) is entry:
+                self._remove(key)
+                self._update_metrics()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.data is not None:
+            self._release(entry)
+
+    def _release(self, entry):
+        session = entry.ref.session
+        self._memory[session] -= entry.ref.size
+        if not self._memory[session]:
+            del self._memory[session]
+        entry.data = None
+
+    def _stored(self, entry, handle, reason):
+        """Records the disk copy of an entry and releases its bytes, under the lock"""
+        entry.handle = handle
+        entry.spilling = False
+        # Entries removed meanwhile were already released
+        if entry.data is not None and self._entries.get((entry.ref.session, entry.ref.name)) is entry:
+            self._release(entry)
+            metrics.SESSION_MEDIA_SPILLS.inc(reason=reason)
+
+    def _select_spills(self, session):
+        """Picks idle artifacts, then LRU ones while a budget is exceeded, under the lock.
+
+        session is the one that just stored something (its budget is
+        checked), or None.
+        """
+        cutoff = time.monotonic() - self.idle_seconds
+        session_bytes = self._memory.get(session, 0)
+        total_bytes = sum(self._memory.values())
+        victims = []
+        for key, entry in self._entries.items():
+            if entry.data is None or entry.spilling:
+                continue
+            if entry.used <= cutoff:
+                reason = 'idle'
+            elif key[0] == session and session_bytes > self.session_bytes:
+                reason = 'session'
+            elif total_bytes > self.total_bytes:
+                reason = 'total'
+            else:
+                continue
+            entry.spilling = True
+            victims.append((entry, entry.data, entry.handle, reason))
+            total_bytes -= entry.ref.size
+            if key[0] == session:
+                session_bytes -= entry.ref.size
+        self._update_metrics()
+        return victims
+
+    def _spill(self, victims):
+        """Writes the picked artifacts to the store outside the lock, then releases their bytes"""
+        for entry, data, handle, reason in victims:
+            try:
+                if not self.store.exists(handle):
+                    handle = self.store.save_bytes(data, entry.ref.extension, entry.ref.mime)
+            except OSError:
+                with self._lock:
+                    entry.spilling = False  # stays in memory
+                continue
+            with self._lock:
+                self._stored(entry, handle, reason)
+        if victims:
+            with self._lock:
+                self._update_metrics()
+
+    def _update_metrics(self):
+        metrics.SESSION_MEDIA_BYTES.set(sum(self._memory.values()), tier='memory')
+        metrics.SESSION_MEDIA_BYTES.set(
+            sum(e.ref.size for e in self._entries.values() if e.data is None), tier='disk')
+        metrics.SESSION_MEDIA_SESSIONS.set(len(self._memory))
@@ -0,0 +1,68 @@
+import http.server
+import threading
+
+import pytest
+
+from refacer import downloads
+from refacer.downloads import DownloadRefused, fetch_bytes
+
+BODY = b'x' * 300_000
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', self.path.split('?to=', 1)[1])
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path != '/no-length':
+            self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+@pytest.fixture
+def server():
+    def serve(host):
+        srv = http.server.ThreadingHTTPServer((host, 0), Handler)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return f"http://{host}:{srv.server_port}"
+
+    servers = []
+    yield serve
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_fetch_bytes_within_limit(server):
+    assert fetch_bytes(server('127.0.0.1') + '/file', max_bytes=len(BODY)) == BODY
+
+
+@pytest.mark.parametrize('path', ['/file', '/no-length'])
+def test_fetch_bytes_refuses_content_over_the_limit(server, path):
+    with pytest.raises(DownloadRefused):
+        fetch_bytes(server('127.0.0.1') + path, max_bytes=len(BODY) - 1)
+
+
+def test_public_only_refuses_loopback(server):
+    with pytest.raises(DownloadRefused):
+        fetch_bytes(server('127.0.0.1') + '/file', public_only=True)
+    with pytest.raises(DownloadRefused):  # refused before connecting, even to a closed port
+        fetch_bytes('http://localhost:9/file', public_only=True)
+
+
+def test_public_only_checks_every_redirect_hop(server, monkeypatch):
+    # 127.0.0.2 stands in for a public host that redirects to a private one
+    monkeypatch.setattr(downloads, '_public_address', lambda address: address == '127.0.0.2')
+    private = server('127.0.0.1')
+    public = server('127.0.0.2')
+    assert fetch_bytes(public + '/file', public_only=True) == BODY
+    with pytest.raises(DownloadRefused):
+        fetch_bytes(f"{public}/redirect?to={private}/file", public_only=True)
@@ -0,0 +1,23 @@
+from refacer.history import History, HistoryOutput
+from refacer.media_store import MediaStore
+
+
+def make_history(tmp_path):
+    return History(str(tmp_path / 'history.sqlite3'), MediaStore(str(tmp_path / 'files'), ttl_seconds=None))
+
+
+def test_record_invalidates_memoized_pages_and_models(tmp_path):
+    history = make_history(tmp_path)
+    history.record('owner/image', 'a sailor cat', 'k1', [HistoryOutput('png', 'image/png', b'one')])
+    entries, total = history.page()
+    assert total == 1
+    assert history.page() == (entries, total)  # served from the memo
+    assert history.models() == ['owner/image']
+
+    history.record('owner/video', 'a sailor dog', 'k2', [HistoryOutput('mp4', 'video/mp4', b'two')])
+
+    entries, total = history.page(query='sailor')
+    assert total == 2
+    assert [entry.prompt for entry in entries] == ['a sailor dog', 'a sailor cat']
+    assert history.models() == ['owner/image', 'owner/video']
+    assert history.page(model='owner/video')[1] == 1
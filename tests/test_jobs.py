@@ -0,0 +1,89 @@
+import threading
+import time
+
+from refacer import jobs
+
+
+class StubPrediction:
+    """Prediction that keeps processing until it is canceled or released"""
+
+    def __init__(self, client):
+        self.id = f"p{len(client.created)}"
+        self.status = jobs.STARTING
+        self.logs = ''
+        self.error = None
+        self.output = None
+        self._client = client
+
+    def reload(self):
+        if self.status == jobs.CANCELED:
+            return
+        if self._client.release.is_set():
+            self.status = jobs.SUCCEEDED
+            self.output = ['https://example.invalid/out.png']
+        else:
+            self.status = jobs.PROCESSING
+
+    def cancel(self):
+        self.status = jobs.CANCELED
+
+
+class StubClient:
+    def __init__(self):
+        self.created = []
+        self.release = threading.Event()
+        self.models = self
+        self.predictions = self
+
+    def create(self, model=None, input=None):
+        prediction = StubPrediction(self)
+        self.created.append(prediction)
+        return prediction
+
+
+def wait_done(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not manager.get(job_id).done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return manager.get(job_id)
+
+
+def test_double_submit_from_one_session_is_canceled_by_one_cancel():
+    client = StubClient()
+    manager = jobs.JobManager(client, poll_interval=0.01)
+    first = manager.submit('owner/model', {'prompt': 'cat'}, session='s1', key='k')
+    second = manager.submit('owner/model', {'prompt': 'cat'}, session='s1', key='k')
+    assert first == second
+    assert manager.get(first).subscribers == {'s1'}
+
+    manager.cancel(first, 's1')
+
+    job = wait_done(manager, first)
+    assert job.status == jobs.CANCELED
+    assert len(client.created) <= 1
+
+
+def test_cancel_keeps_job_running_for_other_sessions():
+    client = StubClient()
+    manager = jobs.JobManager(client, poll_interval=0.01)
+    job_id = manager.submit('owner/model', {'prompt': 'cat'}, session='s1', key='k')
+    assert manager.submit('owner/model', {'prompt': 'cat'}, session='s2', key='k') == job_id
+
+    manager.cancel(job_id, 's1')
+    assert not manager.get(job_id).cancel_requested
+    client.release.set()
+
+    assert wait_done(manager, job_id).status == jobs.SUCCEEDED
+
+
+def test_submit_after_cancel_starts_a_new_job():
+    client = StubClient()
+    manager = jobs.JobManager(client, poll_interval=0.01)
+    job_id = manager.submit('owner/model', {'prompt': 'cat'}, session='s1', key='k')
+    manager.cancel(job_id, 's1')
+
+    new_id = manager.submit('owner/model', {'prompt': 'cat'}, session='s1', key='k')
+    assert new_id != job_id
+    client.release.set()
+    assert wait_done(manager, new_id).status == jobs.SUCCEEDED
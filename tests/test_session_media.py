@@ -0,0 +1,44 @@
+import os
+
+from refacer.media_store import MediaStore
+from refacer.session_media import SessionMedia
+
+
+def make_media(tmp_path, **kwargs):
+    return SessionMedia(MediaStore(str(tmp_path), ttl_seconds=None), **kwargs)
+
+
+def test_sweep_forgets_artifacts_whose_files_the_store_removed(tmp_path):
+    media = make_media(tmp_path)
+    refs = [media.put(f"s{idx}", 'result_0', os.urandom(1000), 'png', 'image/png') for idx in range(50)]
+    for ref in refs:
+        media.handle(ref)  # published: on disk only
+    for entry in os.scandir(tmp_path):
+        os.remove(entry.path)
+
+    media.sweep()
+
+    assert media.stats() == {'memory_bytes': 0, 'disk_bytes': 0, 'sessions': 0, 'artifacts': 0}
+    assert media.get(refs[0]) is None
+
+
+def test_sweep_spills_idle_bytes_without_a_put(tmp_path):
+    media = make_media(tmp_path, idle_seconds=60)
+    ref = media.put('s1', 'result_0', b'x' * 1000, 'png', 'image/png')
+    assert media.session_stats('s1') == (1000, 0)
+    media._entries[('s1', 'result_0')].used -= 120  # unused for two minutes
+
+    media.sweep()
+
+    assert media.session_stats('s1') == (0, 1000)
+    assert media.get(ref) == b'x' * 1000
+
+
+def test_sweep_drops_expired_artifacts(tmp_path):
+    media = make_media(tmp_path, expire_seconds=0)
+    media.put('s1', 'result_0', b'x' * 1000, 'png', 'image/png')
+
+    media.sweep()
+
+    assert media.stats()['artifacts'] == 0
+    assert media.stats()['memory_bytes'] == 0